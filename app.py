@@ -5,6 +5,14 @@ import plotly.graph_objects as go
 import plotly.express as px
 from scipy.stats import pearsonr
 from io import BytesIO
+import hashlib
+
+# Optional Numba acceleration for very large tables
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # Database integration
 try:
@@ -353,9 +361,33 @@ CONTEXT_REFERENCES = {
     }
 }
 
+# EDS element columns as stored in the database (lowercase)
+_EDS_ELEMENTS = ['c', 'n', 'o', 'p', 'ca', 'k', 'al', 'mn', 'fe', 'si', 'mg', 'na', 's', 'cl', 'ti', 'zn']
+
+def normalize_eds_frame(df):
+    """Encode missing-as-zero once so downstream comparisons never see NaN"""
+    df = df.copy()
+    cols = [c for c in _EDS_ELEMENTS if c in df.columns]
+    if cols:
+        df[cols] = df[cols].fillna(0).astype('float32')
+    return df
+
+def ensure_ca_p_ratio(df):
+    """Materialize Ca/P as a vectorized column so authenticate_* functions don't recompute it per row"""
+    if 'ca' in df.columns and 'p' in df.columns and 'ca_p_ratio' not in df.columns:
+        ca = df['ca'].to_numpy()
+        p = df['p'].to_numpy()
+        if ca.dtype.kind != 'f':
+            ca, p = ca.astype(float), p.astype(float)
+        # out dtype follows the inputs, so float32 frames stay float32
+        df['ca_p_ratio'] = np.divide(ca, p, out=np.zeros(len(df), dtype=ca.dtype), where=p > 0)
+    return df
+
 def authenticate_with_context(data, site_context):
     """Apply context-specific authentication criteria"""
-    
+
+    data = ensure_ca_p_ratio(normalize_eds_frame(data))
+
     context_type = site_context.get('context_type', 'unknown')
     
     if context_type in CONTEXT_REFERENCES:
@@ -392,8 +424,7 @@ def authenticate_guano_cave(data, context_params, site_context):
         C = row.get('c', 0)
         P = row.get('p', 0)
         Mn = row.get('mn', 0)
-        Ca = row.get('ca', 0)
-        
+
         corrected_P = max(0, P - guano_baseline_P)
         
         if Mn > context_params['expected_signatures']['Mn_indicator']:
@@ -411,7 +442,7 @@ def authenticate_guano_cave(data, context_params, site_context):
         if corrected_C_val > 20:
             classification = "Organic"
             confidence = "High" if corrected_P < 2 else "Medium"
-        elif corrected_P > 10 and Ca/P < 2.0 if P > 0 else False:
+        elif corrected_P > 10 and 0 < row.get('ca_p_ratio', 0) < 2.0:
             classification = "Apatite"
             confidence = "Medium"
         elif corrected_C_val < 5 and corrected_P < 2:
@@ -478,17 +509,48 @@ def authenticate_peat_bog(data, context_params):
     
     return results
 
+# Class codes written by _classify_standard, mapped to strings in one pass
+_STANDARD_CLASS_LABELS = np.array(['Organic', 'Apatite', 'Mimic', 'Mixed/Uncertain'])
+_STANDARD_CONF_LABELS = np.array(['High', 'High', 'High', 'Medium'])
+
+# Row counts below this aren't worth the JIT warm-up
+_NUMBA_MIN_ROWS = 10_000
+
+if NUMBA_AVAILABLE:
+    @numba.njit(parallel=True, cache=True)
+    def _classify_standard(C, P, cap, out):
+        for i in numba.prange(C.shape[0]):
+            if C[i] > 20 and P[i] < 3:
+                out[i] = 0
+            elif P[i] > 10 and 1.2 < cap[i] < 2.2:
+                out[i] = 1
+            elif C[i] < 10 and P[i] < 3:
+                out[i] = 2
+            else:
+                out[i] = 3
+
 def authenticate_standard(data):
     """Standard Karkanas & Weiner (2010) criteria"""
-    
-    results = data.copy()
-    
+
+    results = ensure_ca_p_ratio(normalize_eds_frame(data))
+
+    # Fused JIT kernel for bulk re-classification of very large tables:
+    # writes int8 class codes into a preallocated buffer, no intermediates
+    if NUMBA_AVAILABLE and len(results) >= _NUMBA_MIN_ROWS and 'c' in results.columns and 'p' in results.columns:
+        C = results['c'].to_numpy(dtype=np.float32)
+        P = results['p'].to_numpy(dtype=np.float32)
+        cap = results['ca_p_ratio'].to_numpy(dtype=np.float32)
+        out = np.empty(len(results), dtype=np.int8)
+        _classify_standard(C, P, cap, out)
+        results['context_adjusted_classification'] = _STANDARD_CLASS_LABELS[out]
+        results['confidence_level'] = _STANDARD_CONF_LABELS[out]
+        return results
+
     for idx, row in results.iterrows():
         C = row.get('c', 0)
         P = row.get('p', 0)
-        Ca = row.get('ca', 0)
-        Ca_P = Ca/P if P > 0 else 0
-        
+        Ca_P = row.get('ca_p_ratio', 0)
+
         if C > 20 and P < 3:
             classification = "Organic"
             confidence = "High"
@@ -549,15 +611,37 @@ def calculate_correlations(df):
 # HELPER FUNCTIONS FOR ENHANCED SITE FORM
 # ================================================
 
+# Hoisted so reruns don't rebuild these literals per call
+_CONTEXT_DESCRIPTIONS = {
+    "cave_guano": "High P (3-20%), Mn indicator for bat guano",
+    "cave_carbonate": "High Ca, moderate P (0.5-3%)",
+    "open_air_sand": "Low P (<2%), Si contamination",
+    "peat_bog": "Very low P, excellent organic preservation"
+}
+_DEFAULT_CONTEXT_DESCRIPTION = "See literature for expected signatures"
+
+_CONTEXT_TYPE_LABELS = {
+    "cave_guano": "🦇 Cave (Guano-Rich)",
+    "cave_carbonate": "🪨 Cave (Carbonate)",
+    "cave_other": "🕳️ Cave (Other)",
+    "rockshelter": "🏔️ Rockshelter",
+    "open_air_sand": "🏖️ Open-Air (Sand)",
+    "open_air_clay": "🧱 Open-Air (Clay)",
+    "open_air_loess": "🌾 Open-Air (Loess)",
+    "peat_bog": "🌿 Peat Bog",
+    "volcanic_ash": "🌋 Volcanic Ash",
+    "other": "❓ Other"
+}
+
+
+def _fmt_context_type(value):
+    '''Selectbox format_func, defined once instead of per rerun'''
+    return _CONTEXT_TYPE_LABELS.get(value, value)
+
+
 def get_context_description(context_type):
     '''Get brief description of expected signatures'''
-    descriptions = {
-        "cave_guano": "High P (3-20%), Mn indicator for bat guano",
-        "cave_carbonate": "High Ca, moderate P (0.5-3%)",
-        "open_air_sand": "Low P (<2%), Si contamination",
-        "peat_bog": "Very low P, excellent organic preservation"
-    }
-    return descriptions.get(context_type, "See literature for expected signatures")
+    return _CONTEXT_DESCRIPTIONS.get(context_type, _DEFAULT_CONTEXT_DESCRIPTION)
 
 def render_enhanced_site_form(db):
     '''Enhanced site registration form with full taphonomic context'''
@@ -603,18 +687,7 @@ def render_enhanced_site_form(db):
                 "cave_guano", "cave_carbonate", "cave_other",
                 "rockshelter", "open_air_sand", "open_air_clay",
                 "open_air_loess", "peat_bog", "volcanic_ash", "other"
-            ], format_func=lambda x: {
-                "cave_guano": "🦇 Cave (Guano-Rich)",
-                "cave_carbonate": "🪨 Cave (Carbonate)",
-                "cave_other": "🕳️ Cave (Other)",
-                "rockshelter": "🏔️ Rockshelter",
-                "open_air_sand": "🏖️ Open-Air (Sand)",
-                "open_air_clay": "🧱 Open-Air (Clay)",
-                "open_air_loess": "🌾 Open-Air (Loess)",
-                "peat_bog": "🌿 Peat Bog",
-                "volcanic_ash": "🌋 Volcanic Ash",
-                "other": "❓ Other"
-            }.get(x, x))
+            ], format_func=_fmt_context_type)
             
             if context_type in ["cave_guano", "open_air_sand", "peat_bog"]:
                 st.caption(f"ℹ️ {get_context_description(context_type)}")
@@ -676,46 +749,47 @@ def render_enhanced_site_form(db):
             submitted = st.form_submit_button("✅ Register Site", type="primary")
             
             if submitted and site_name and country:
-                try:
-                    # Get or create project
-                    projects = db.get_projects()
-                    if not projects or len(projects) == 0:
-                        default_project = db.create_project(
-                            project_name="Default Project",
-                            description="Auto-created"
-                        )
-                        project_id = default_project['project_id']
-                    else:
-                        project_id = projects[0]['project_id']
+                # Idempotency key: a double-clicked submit on a slow
+                # network fires two reruns; skip the second identical write
+                write_key = hashlib.blake2b(
+                    f"{site_name}|{country}|{latitude}|{longitude}".encode(),
+                    digest_size=16).hexdigest()
+                if st.session_state.get('_last_site_write') == write_key:
+                    st.info(f"ℹ️ {site_name} was just registered - skipping duplicate submit")
+                else:
+                    try:
+                        # Get or create project (resolved once per session)
+                        project_id = db.get_default_project_id()
                     
-                    # Create site
-                    site_data = {
-                        "project_id": project_id,
-                        "site_name": site_name,
-                        "country": country,
-                        "latitude": latitude,
-                        "longitude": longitude,
-                        "elevation": elevation,
-                        "climate_zone": climate_zone,
-                        "context_type": context_type,
-                        "ph_condition": ph_condition,
-                        "water_table": water_table,
-                        "guano_presence": guano_presence,
-                        "organic_preservation": organic_preservation,
-                        "site_references": site_references,
-                        "taphonomic_notes": taphonomic_notes
-                    }
+                        # Create site
+                        site_data = {
+                            "project_id": project_id,
+                            "site_name": site_name,
+                            "country": country,
+                            "latitude": latitude,
+                            "longitude": longitude,
+                            "elevation": elevation,
+                            "climate_zone": climate_zone,
+                            "context_type": context_type,
+                            "ph_condition": ph_condition,
+                            "water_table": water_table,
+                            "guano_presence": guano_presence,
+                            "organic_preservation": organic_preservation,
+                            "site_references": site_references,
+                            "taphonomic_notes": taphonomic_notes
+                        }
                     
-                    site = db.client.table("sites").insert(site_data).execute()
+                        site = db.client.table("sites").insert(site_data).execute()
                     
-                    if site.data:
-                        st.success(f"✅ Registered: {site_name} with context!")
-                        st.session_state.current_site_id = site.data[0]['site_id']
-                        st.rerun()
+                        if site.data:
+                            st.session_state['_last_site_write'] = write_key
+                            st.success(f"✅ Registered: {site_name} with context!")
+                            st.session_state.current_site_id = site.data[0]['site_id']
+                            st.rerun()
                     
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
-                    st.exception(e)
+                    except Exception as e:
+                        st.error(f"Error: {str(e)}")
+                        st.exception(e)
 
 # NAVIGATION - v2.3 CLEAN STRUCTURE
 # ==============================================
@@ -1068,11 +1142,12 @@ elif page == "Data Import":
                 else:
                     df = pd.read_excel(uploaded_file)
                 
-                # Convert numeric columns to float
+                # Convert numeric columns to float32 (wt% never needs double
+                # precision; halves memory through the vectorized pipeline)
                 numeric_cols = ['C', 'N', 'O', 'P', 'Ca', 'K', 'Al', 'Mn', 'Fe', 'Si', 'Mg', 'Na', 'S', 'Cl', 'Ti', 'Zn']
                 for col in numeric_cols:
                     if col in df.columns:
-                        df[col] = pd.to_numeric(df[col], errors='coerce')
+                        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
                 
                 # Check required columns
                 required_cols = ['C', 'P', 'Ca', 'Mn']
@@ -1716,18 +1791,8 @@ elif page == "Sites" and database_enabled:
                 
                 if submitted and site_name:
                     try:
-                        # Create a default project if none exists
-                        projects = db.get_projects()
-                        if not projects or len(projects) == 0:
-                            # Create default project
-                            default_project = db.create_project(
-                                project_name="Default Project",
-                                description="Auto-created default project"
-                            )
-                            project_id = default_project['project_id']
-                        else:
-                            # Use first project
-                            project_id = projects[0]['project_id']
+                        # Get or create project (resolved once per session)
+                        project_id = db.get_default_project_id("Auto-created default project")
                         
                         site = db.create_site(
                             project_id=project_id,
@@ -1785,15 +1850,14 @@ elif page == "Sites" and database_enabled:
             st.warning("⚠️ Please select a site first (Sites tab)")
         else:
             try:
-                # Get selected site info
-                sites = db.get_sites()
-                current_site = next((s for s in sites if s['site_id'] == st.session_state.current_site_id), None)
-                
+                # Site row and samples fetched concurrently
+                overview = db.get_site_overview(st.session_state.current_site_id)
+                current_site = overview['site']
+
                 if current_site:
                     st.info(f"📍 Selected site: **{current_site['site_name']}**")
-                
-                # Get samples for this site
-                samples = db.get_samples(site_id=st.session_state.current_site_id)
+
+                samples = overview['samples']
                 
                 if samples and len(samples) > 0:
                     st.success(f"Found {len(samples)} samples")
@@ -1918,7 +1982,10 @@ elif page == "Statistics" and database_enabled:
         if len(projects) > 0:
             # Convert list to DataFrame for easier iteration
             projects_df = pd.DataFrame(projects)
-            
+
+            # One batched query for all projects instead of one per project
+            sites_by_project = db.get_sites_for_projects([p['project_id'] for p in projects])
+
             for _, proj in projects_df.iterrows():
                 with st.expander(f"📂 {proj['project_name']}"):
                     col1, col2 = st.columns(2)
@@ -1933,8 +2000,8 @@ elif page == "Statistics" and database_enabled:
                         st.write(f"**Created:** {proj['created_at'][:10]}")
                         st.write(f"**Public:** {'Yes' if proj.get('is_public') else 'No'}")
                     
-                    # Get project sites
-                    sites = db.get_sites(proj['project_id'])
+                    # Get project sites (batched above)
+                    sites = sites_by_project.get(proj['project_id'], [])
                     st.write(f"**Sites:** {len(sites)}")
         else:
             st.info("No projects yet")
@@ -2255,11 +2322,13 @@ elif page == "Library Statistics" and database_enabled and LIBRARY_PAGES_AVAILAB
     
     try:
         db = get_db_connection()
-        library_entries = db.get_library_entries()
-        
+        # This page only counts entries, so project just those columns
+        library_entries = db.get_library_entries(
+            columns="library_id,spectrum_type,material_type,verified")
+
         if library_entries:
             from collections import Counter
-            
+
             col1, col2, col3 = st.columns(3)
             
             with col1:
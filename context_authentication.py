@@ -171,6 +171,17 @@ CONTEXT_REFERENCES = {
 # CONTEXT-AWARE AUTHENTICATION FUNCTION
 # ================================================
 
+def ensure_ca_p_ratio(df):
+    """Materialize Ca/P as a vectorized column so authenticate_* functions don't recompute it per row"""
+    if 'ca' in df.columns and 'p' in df.columns and 'ca_p_ratio' not in df.columns:
+        ca = df['ca'].to_numpy()
+        p = df['p'].to_numpy()
+        if ca.dtype.kind != 'f':
+            ca, p = ca.astype(float), p.astype(float)
+        # out dtype follows the inputs, so float32 frames stay float32
+        df['ca_p_ratio'] = np.divide(ca, p, out=np.zeros(len(df), dtype=ca.dtype), where=p > 0)
+    return df
+
 def authenticate_with_context(data, site_context):
     """
     Apply context-specific authentication criteria
@@ -192,8 +203,10 @@ def authenticate_with_context(data, site_context):
         Key publications cited
     """
     
+    data = ensure_ca_p_ratio(data.copy())
+
     context_type = site_context.get('context_type', 'unknown')
-    
+
     # Get context parameters
     if context_type in CONTEXT_REFERENCES:
         context_params = CONTEXT_REFERENCES[context_type]
@@ -237,8 +250,7 @@ def authenticate_guano_cave(data, context_params, site_context):
         C = row.get('c', 0)
         P = row.get('p', 0)
         Mn = row.get('mn', 0)
-        Ca = row.get('ca', 0)
-        
+
         # Correct for guano contribution
         corrected_P = max(0, P - guano_baseline_P)
         
@@ -262,7 +274,7 @@ def authenticate_guano_cave(data, context_params, site_context):
         if corrected_C_val > 20:
             classification = "Organic"
             confidence = "High" if corrected_P < 2 else "Medium"
-        elif corrected_P > 10 and Ca/P < 2.0 if P > 0 else False:
+        elif corrected_P > 10 and 0 < row.get('ca_p_ratio', 0) < 2.0:
             classification = "Apatite"
             confidence = "Medium"  # Guano complicates
         elif corrected_C_val < 5 and corrected_P < 2:
@@ -356,15 +368,14 @@ def authenticate_peat_bog(data, context_params):
 
 def authenticate_standard(data):
     """Standard Karkanas & Weiner (2010) criteria"""
-    
-    results = data.copy()
-    
+
+    results = ensure_ca_p_ratio(data.copy())
+
     for idx, row in results.iterrows():
         C = row.get('c', 0)
         P = row.get('p', 0)
-        Ca = row.get('ca', 0)
-        Ca_P = Ca/P if P > 0 else 0
-        
+        Ca_P = row.get('ca_p_ratio', 0)
+
         if C > 20 and P < 3:
             classification = "Organic"
             confidence = "High"
@@ -4,19 +4,264 @@ Handles all database operations using Supabase
 Includes residue-based data model with context-aware features
 """
 
+import atexit
 import os
-from supabase import create_client, Client
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import numpy as np
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 import streamlit as st
-from datetime import datetime
-from typing import Optional, Dict, List, Any
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+# Bulk inserts are split into chunks of this size; chunks are submitted
+# concurrently (the Supabase client is I/O-bound on the HTTP call)
+_BULK_CHUNK = 500
+_BULK_WORKERS = 8
+
+# Search-log writes are flushed by a background thread in batches of
+# _LOG_BATCH rows or every _LOG_FLUSH_SECS, whichever comes first
+_LOG_BATCH = 50
+_LOG_FLUSH_SECS = 1.0
+
+# eds_analyses element columns, in table order
+_ELEMENT_COLS = ('c', 'n', 'o', 'p', 'ca', 'k', 'al', 'mn', 'fe', 'si', 'mg', 'na', 's', 'cl', 'ti', 'zn')
+
+# Columns fetched by list-returning getters; detail views (get_project,
+# get_site, get_sample, get_site_dataset) still select * for the full row.
+LIST_COLUMNS = {
+    "projects": "project_id,project_name,description,institution,principal_investigator,is_public,created_at",
+    "sites": "site_id,project_id,site_name,country,region,latitude,longitude,elevation,"
+             "context_type,time_period,excavation_year,created_at",
+    "samples": "sample_id,site_id,sample_code,tool_type,material,context,created_at",
+    "residues": "residue_id,sample_id,residue_number,location_on_tool,visual_color,"
+                "visual_preservation,created_at",
+    "eds_analyses": "analysis_id,residue_id,analysis_point_number,classification,ca_p_ratio,"
+                    + ",".join(_ELEMENT_COLS) + ",created_at",
+    # Everything the library views and search matrix consume; the raw
+    # FTIR spectrum blob stays out unless explicitly requested
+    "library_complete_mv": "library_id,spectrum_name,spectrum_code,spectrum_type,material_type,"
+                           "material_subtype,source_type,source_reference,source_institution,"
+                           "verified,quality_score,contamination_level,keywords,description,"
+                           "has_eds,has_ftir,"
+                           + ",".join("eds_" + col for col in _ELEMENT_COLS) + ",created_at",
+}
+
+
+# Optional site columns accepted by create_site; create_site_with_context
+# extends this with the taphonomic context set so the two writers share
+# one field list instead of drifting apart
+_SITE_FIELDS = ('country', 'region', 'latitude', 'longitude', 'elevation',
+                'context_type', 'time_period', 'excavation_year')
+_SITE_CONTEXT_FIELDS = _SITE_FIELDS + (
+    'climate_zone', 'rainfall_regime', 'temperature_regime',
+    'context_type_detailed', 'ph_condition', 'water_table',
+    'microbial_activity', 'guano_presence', 'organic_preservation',
+    'mineral_preservation', 'site_references', 'geoarch_studies',
+    'context_confidence', 'taphonomic_notes')
+
+
+def normalize_elemental_data(elemental_data: Dict) -> Dict:
+    """Map an elemental dict (any key casing) onto the eds_analyses columns
+
+    Lowercases the input in one pass instead of probing both key casings
+    per element, so import paths can hand over DataFrame rows as-is.
+    """
+    low = {key.lower(): value for key, value in elemental_data.items()}
+    return {col: low.get(col) for col in _ELEMENT_COLS}
+
+
+def _group_by(rows: List[Dict], key: str) -> Dict[str, List[Dict]]:
+    """Group rows by a key column (single pass, preserves row order)"""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.get(key)].append(row)
+    return grouped
+
+
+# Shared Supabase client - one httpx session with TCP/TLS keep-alive
+# reused across all Streamlit sessions instead of one client per session.
+# The supabase package (and its postgrest/gotrue/storage3 dependencies)
+# is imported lazily so pages that never touch the DB skip its ~100ms
+# cold-start cost.
+_CLIENT: Optional["Client"] = None
+
+
+def _get_client(supabase_url: str, supabase_key: str) -> "Client":
+    """Create the process-wide Supabase client once and reuse it"""
+    global _CLIENT
+    if _CLIENT is None:
+        from supabase import create_client
+
+        _CLIENT = create_client(supabase_url, supabase_key)
+        try:
+            old_session = _CLIENT.postgrest.session
+            _CLIENT.postgrest.session = httpx.Client(
+                base_url=old_session.base_url,
+                headers=old_session.headers,
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=50,
+                                    keepalive_expiry=1800)
+            )
+        except AttributeError:
+            # Client internals changed - keep the default session
+            pass
+    return _CLIENT
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_row(_db, url_key: str, table: str, id_column: str, row_id: str,
+                    version: int = 0) -> Optional[Dict]:
+    """Cached single-row lookup (the _db argument is excluded from the cache key)
+
+    version is the per-table write counter: bumping it on writes makes
+    stale entries unreachable without waiting for the TTL.
+    """
+    result = _db.client.table(table).select("*").eq(id_column, row_id).execute()
+    return result.data[0] if result.data else None
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_projects(_db, url_key: str, limit: int, offset: int, version: int = 0) -> List[Dict]:
+    """Cached project listing (version-keyed like _cached_get_row)"""
+    result = _db.client.table("projects").select(LIST_COLUMNS["projects"]) \
+        .order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+    return result.data if result.data else []
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_sites(_db, url_key: str, project_id: Optional[str], limit: int, offset: int,
+                      version: int = 0) -> List[Dict]:
+    """Cached site listing (version-keyed like _cached_get_row)"""
+    query = _db.client.table("sites").select(LIST_COLUMNS["sites"])
+    if project_id:
+        query = query.eq("project_id", project_id)
+    result = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+    return result.data if result.data else []
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_get_residues(_db, url_key: str, sample_id: Optional[str], residue_id: Optional[str],
+                         version: int = 0, columns: str = "*") -> List[Dict]:
+    """Cached residue listing (version-keyed like _cached_get_row)"""
+    query = _db.client.table("residues").select(columns)
+    if residue_id:
+        query = query.eq("residue_id", residue_id)
+    elif sample_id:
+        query = query.eq("sample_id", sample_id)
+    result = query.order("residue_number", desc=False).execute()
+    return result.data if result.data else []
+
+
+@st.cache_data(ttl=60, show_spinner=False, max_entries=64)
+def _cached_get_library_entries(_db, url_key: str, spectrum_type: Optional[str],
+                                material_type: Optional[str], verified_only: bool,
+                                multimodal_only: bool, limit: int, offset: int,
+                                include_spectra: bool, columns: Optional[str] = None,
+                                spectrum_types: Optional[tuple] = None,
+                                material_types: Optional[tuple] = None,
+                                require_eds: bool = False,
+                                version: int = 0) -> List[Dict]:
+    """Cached library listing (version-keyed like _cached_get_row)"""
+    if columns is None:
+        columns = "*" if include_spectra else LIST_COLUMNS["library_complete_mv"]
+    query = _db.client.table("library_complete_mv").select(columns)
+
+    if spectrum_type:
+        query = query.eq("spectrum_type", spectrum_type)
+    elif spectrum_types:
+        query = query.in_("spectrum_type", list(spectrum_types))
+    if material_type:
+        query = query.eq("material_type", material_type)
+    elif material_types:
+        query = query.in_("material_type", list(material_types))
+    if verified_only:
+        query = query.eq("verified", True)
+    if multimodal_only:
+        query = query.eq("has_eds", True).eq("has_ftir", True)
+    elif require_eds:
+        query = query.eq("has_eds", True)
+
+    # Deterministic order so offset pagination never skips or repeats rows
+    result = query.order("library_id").range(offset, offset + limit - 1).execute()
+    return result.data if result.data else []
+
+
+@st.cache_data(ttl=60, show_spinner=False, max_entries=64)
+def _cached_get_eds_analyses(_db, url_key: str, residue_id: Optional[str],
+                             sample_id: Optional[str], site_id: Optional[str],
+                             limit: int, offset: int, created_before: Optional[str],
+                             version: int = 0) -> List[Dict]:
+    """Cached EDS analysis listing (version-keyed like _cached_get_row)"""
+    return _db._fetch_eds_analyses(residue_id=residue_id, sample_id=sample_id,
+                                   site_id=site_id, limit=limit, offset=offset,
+                                   created_before=created_before)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_library_statistics(_db, url_key: str, version: int = 0) -> Dict:
+    """Cached library statistics read (version-keyed like _cached_get_row)"""
+    result = _db.client.table("library_statistics_mv").select("*").execute()
+    return result.data[0] if result.data else {}
 
 
 class TaphoSpecDB:
     """Database handler for TaphoSpec using Supabase"""
-    
+
     def __init__(self, supabase_url: str, supabase_key: str):
-        """Initialize database connection"""
-        self.client: Client = create_client(supabase_url, supabase_key)
+        """Initialize database connection (shares the module-level client)"""
+        self.client: "Client" = _get_client(supabase_url, supabase_key)
+        # Used as a hashable cache key for st.cache_data lookups
+        self._url = supabase_url
+        # Per-table write counters; cached reads key on these so any
+        # write invalidates the matching lookups immediately
+        self._ver = defaultdict(int)
+        # Fire-and-forget search logging (drained by a daemon thread)
+        self._log_queue = queue.SimpleQueue()
+        self._log_thread: Optional[threading.Thread] = None
+        # In-process library matrix cache, keyed by element tuple and
+        # cleared by library writes (rows mutate rarely vs searches)
+        self._lib_cache: Dict[tuple, tuple] = {}
+
+    def _bulk_insert(self, table: str, rows: List[Dict], parallel: bool = True,
+                     upsert_on: str = None) -> List[Dict]:
+        """Insert rows in chunks, overlapping network round-trips across chunks
+
+        With upsert_on set, each chunk is upserted on that conflict
+        column instead of plain-inserted.
+        """
+        if not rows:
+            return []
+
+        chunks = [rows[i:i + _BULK_CHUNK] for i in range(0, len(rows), _BULK_CHUNK)]
+
+        def insert_chunk(chunk):
+            if upsert_on:
+                result = self.client.table(table).upsert(chunk, on_conflict=upsert_on).execute()
+            else:
+                result = self.client.table(table).insert(chunk).execute()
+            return result.data if result.data else []
+
+        if not parallel or len(chunks) == 1:
+            inserted = [insert_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=_BULK_WORKERS) as pool:
+                inserted = list(pool.map(insert_chunk, chunks))
+
+        return [row for chunk_data in inserted for row in chunk_data]
     
     # ================================================
     # PROJECT MANAGEMENT
@@ -26,60 +271,161 @@ class TaphoSpecDB:
         """Create a new project"""
         data = {
             "project_name": project_name,
-            "description": description,
-            "created_at": datetime.utcnow().isoformat()
+            "description": description
         }
+        data = {k: v for k, v in data.items() if v is not None}
         result = self.client.table("projects").insert(data).execute()
+        self._ver["projects"] += 1
         return result.data[0] if result.data else None
     
-    def get_projects(self) -> List[Dict]:
-        """Get all projects"""
-        result = self.client.table("projects").select("*").execute()
-        return result.data if result.data else []
+    def get_projects(self, limit: int = 1000, offset: int = 0) -> List[Dict]:
+        """Get projects (paginated, newest first, cached for 60s)"""
+        return _cached_get_projects(self, self._url, limit, offset, self._ver["projects"])
     
     def get_project(self, project_id: str) -> Optional[Dict]:
-        """Get a specific project"""
-        result = self.client.table("projects").select("*").eq("project_id", project_id).execute()
-        return result.data[0] if result.data else None
-    
+        """Get a specific project (cached for 60s)"""
+        return _cached_get_row(self, self._url, "projects", "project_id", project_id,
+                               self._ver["projects"])
+
+    def get_default_project_id(self, description: str = "Auto-created") -> str:
+        """Resolve the project new sites attach to, once per session
+
+        The first call lists projects (creating "Default Project" when
+        none exist) and stashes the id in st.session_state, so repeat
+        form submissions skip the lookup round-trip entirely.
+        """
+        project_id = st.session_state.get('default_project_id')
+        if not project_id:
+            projects = self.get_projects(limit=1)
+            if projects:
+                project_id = projects[0]['project_id']
+            else:
+                project_id = self.create_project("Default Project", description)['project_id']
+            st.session_state.default_project_id = project_id
+        return project_id
+
+    def get_dashboard(self, project_id: str) -> Dict[str, Any]:
+        """Fetch project, sites and samples for one dashboard render
+
+        The project and site reads are independent, so they run
+        concurrently and the wall time is the slowest round-trip rather
+        than their sum; samples are then batch-fetched for the returned
+        sites.
+        """
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            project_future = pool.submit(self.get_project, project_id)
+            sites_future = pool.submit(self.get_sites, project_id)
+            sites = sites_future.result()
+            project = project_future.result()
+
+        samples_by_site = self.get_samples_for_sites([s['site_id'] for s in sites])
+        return {
+            "project": project,
+            "sites": sites,
+            "samples_by_site": samples_by_site,
+        }
+
+    def get_project_dataset(self, project_id: str) -> List[Dict]:
+        """Get every site/sample/residue/analysis under a project in one query
+
+        Same embedded select as get_site_dataset, one level up: a single
+        round-trip returns the whole tree instead of a query per site
+        and per sample.
+        """
+        result = self.client.table("sites") \
+            .select("*,samples(*,residues(*,eds_analyses(*)))") \
+            .eq("project_id", project_id) \
+            .execute()
+        return result.data if result.data else []
+
+    def export_project_to_csv(self, project_id: str) -> str:
+        """Export a project's analyses as CSV, one row per EDS analysis"""
+        df = site_dataset_to_dataframe(self.get_project_dataset(project_id))
+        return df.to_csv(index=False)
+
     # ================================================
     # SITE MANAGEMENT
     # ================================================
     
     def create_site(self, project_id: str, site_name: str, **kwargs) -> Dict:
         """Create a new site"""
-        data = {
-            "project_id": project_id,
-            "site_name": site_name,
-            "country": kwargs.get('country'),
-            "region": kwargs.get('region'),
-            "latitude": kwargs.get('latitude'),
-            "longitude": kwargs.get('longitude'),
-            "elevation": kwargs.get('elevation'),
-            "context_type": kwargs.get('context_type'),
-            "time_period": kwargs.get('time_period'),
-            "excavation_year": kwargs.get('excavation_year'),
-            "created_at": datetime.utcnow().isoformat()
-        }
-        # Remove None values
-        data = {k: v for k, v in data.items() if v is not None}
-        
+        data = {"project_id": project_id, "site_name": site_name}
+        data.update({field: kwargs[field] for field in _SITE_FIELDS
+                     if kwargs.get(field) is not None})
+
         result = self.client.table("sites").insert(data).execute()
+        self._ver["sites"] += 1
         return result.data[0] if result.data else None
     
-    def get_sites(self, project_id: str = None) -> List[Dict]:
-        """Get all sites"""
-        query = self.client.table("sites").select("*")
-        if project_id:
-            query = query.eq("project_id", project_id)
-        result = query.execute()
-        return result.data if result.data else []
+    def create_site_with_context(self, project_id: str, site_name: str, **context_params) -> Dict:
+        """Create a site with full taphonomic context via one RPC
+
+        The payload travels as a single jsonb argument to the
+        create_site_with_context function (see sql/), which inserts and
+        returns the row server-side - no per-column NULL stripping and
+        no follow-up fetch.
+        """
+        data = {"project_id": project_id, "site_name": site_name}
+        if context_params.get('context_description') is not None:
+            data["context_type_detailed"] = context_params['context_description']
+        data.update({field: context_params[field] for field in _SITE_CONTEXT_FIELDS
+                     if context_params.get(field) is not None})
+
+        result = self.client.rpc('create_site_with_context', {'p': data}).execute()
+        self._ver["sites"] += 1
+        return result.data if isinstance(result.data, dict) else \
+            (result.data[0] if result.data else None)
+
+    def get_sites(self, project_id: str = None, limit: int = 1000, offset: int = 0) -> List[Dict]:
+        """Get sites (paginated, newest first, cached for 60s)"""
+        return _cached_get_sites(self, self._url, project_id, limit, offset, self._ver["sites"])
     
+    def get_sites_for_projects(self, project_ids: List[str]) -> Dict[str, List[Dict]]:
+        """Batch-fetch sites for many projects in one query, grouped by project_id
+
+        Replaces per-project get_sites() calls in UI loops (N+1 pattern)
+        with a single in_() query.
+        """
+        if not project_ids:
+            return {}
+
+        result = self.client.table("sites").select(LIST_COLUMNS["sites"]) \
+            .in_("project_id", project_ids).execute()
+
+        grouped = _group_by(result.data or [], "project_id")
+        return {project_id: grouped.get(project_id, []) for project_id in project_ids}
+
     def get_site(self, site_id: str) -> Optional[Dict]:
-        """Get a specific site"""
-        result = self.client.table("sites").select("*").eq("site_id", site_id).execute()
-        return result.data[0] if result.data else None
-    
+        """Get a specific site (cached for 60s)"""
+        return _cached_get_row(self, self._url, "sites", "site_id", site_id,
+                               self._ver["sites"])
+
+    def get_site_dataset(self, site_id: str) -> List[Dict]:
+        """Get a site with its samples, residues and EDS analyses in one round trip
+
+        Replaces the get_site() + get_samples() + get_eds_analyses() sequence
+        with a single PostgREST embedded select (server-side join).
+        Use site_dataset_to_dataframe() to flatten the result.
+        """
+        result = self.client.table("sites") \
+            .select("*,samples(*,residues(*,eds_analyses(*)))") \
+            .eq("site_id", site_id).execute()
+        return result.data if result.data else []
+
+    def get_site_overview(self, site_id: str) -> Dict[str, Any]:
+        """Fetch a site row and its samples for one page render
+
+        The two reads are independent, so they run concurrently as in
+        get_dashboard and the wall time is one round-trip, not two.
+        """
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            site_future = pool.submit(self.get_site, site_id)
+            samples_future = pool.submit(self.get_samples, site_id=site_id)
+            samples = samples_future.result()
+            site = site_future.result()
+
+        return {"site": site, "samples": samples}
+
     # ================================================
     # SAMPLE MANAGEMENT
     # ================================================
@@ -91,24 +437,94 @@ class TaphoSpecDB:
             "sample_code": sample_code,
             "tool_type": kwargs.get('tool_type'),
             "material": kwargs.get('material'),
-            "context": kwargs.get('context'),
-            "created_at": datetime.utcnow().isoformat()
+            "context": kwargs.get('context')
         }
         data = {k: v for k, v in data.items() if v is not None}
         result = self.client.table("samples").insert(data).execute()
+        self._ver["samples"] += 1
         return result.data[0] if result.data else None
     
-    def get_samples(self, site_id: str = None) -> List[Dict]:
-        """Get all samples"""
-        query = self.client.table("samples").select("*")
+    def get_samples(self, site_id: str = None, limit: int = 1000, offset: int = 0) -> List[Dict]:
+        """Get samples (paginated - use iter_samples to stream everything)"""
+        query = self.client.table("samples").select(LIST_COLUMNS["samples"])
         if site_id:
             query = query.eq("site_id", site_id)
-        result = query.execute()
+        result = query.range(offset, offset + limit - 1).execute()
         return result.data if result.data else []
+
+    def iter_samples(self, site_id: str = None, page_size: int = 1000):
+        """Iterate over all samples in page_size batches"""
+        offset = 0
+        while True:
+            page = self.get_samples(site_id=site_id, limit=page_size, offset=offset)
+            if not page:
+                break
+            yield page
+            if len(page) < page_size:
+                break
+            offset += page_size
     
+    def get_samples_for_sites(self, site_ids: List[str]) -> Dict[str, List[Dict]]:
+        """Batch-fetch samples for many sites in one query, grouped by site_id
+
+        Companion to get_sites_for_projects for the same N+1 fix one
+        level down.
+        """
+        if not site_ids:
+            return {}
+
+        result = self.client.table("samples").select(LIST_COLUMNS["samples"]) \
+            .in_("site_id", site_ids).execute()
+
+        grouped = _group_by(result.data or [], "site_id")
+        return {site_id: grouped.get(site_id, []) for site_id in site_ids}
+
+    def search_samples(self, site_id: str = None, tool_type: str = None,
+                       material: str = None, context_type: str = None) -> List[Dict]:
+        """Search samples with every filter pushed to PostgREST
+
+        context_type lives on the parent site; the !inner embed makes
+        the embedded filter restrict samples server-side, so only
+        matching rows cross the network instead of being post-filtered
+        in pandas.
+        """
+        query = self.client.table("samples") \
+            .select(LIST_COLUMNS["samples"] + ",sites!inner(site_name,context_type)")
+        if site_id:
+            query = query.eq("site_id", site_id)
+        if tool_type:
+            query = query.eq("tool_type", tool_type)
+        if material:
+            query = query.eq("material", material)
+        if context_type:
+            query = query.eq("sites.context_type", context_type)
+
+        result = query.execute()
+        return result.data if result.data else []
+
+    def bulk_create_samples(self, samples_data: List[Dict], parallel: bool = True) -> List[Dict]:
+        """Create multiple samples in chunked, concurrent inserts"""
+        created = self._bulk_insert("samples", samples_data, parallel=parallel)
+        self._ver["samples"] += 1
+        return created
+
     def get_sample(self, sample_id: str) -> Optional[Dict]:
-        """Get a specific sample"""
-        result = self.client.table("samples").select("*").eq("sample_id", sample_id).execute()
+        """Get a specific sample (cached for 60s)"""
+        return _cached_get_row(self, self._url, "samples", "sample_id", sample_id,
+                               self._ver["samples"])
+
+    def get_sample_with_residues(self, sample_id: str) -> Optional[Dict]:
+        """Get a sample with its residues and their EDS analyses
+
+        One embedded select instead of a sample query, a residue query
+        and an EDS query per residue; each residue comes back carrying
+        its eds_analyses list.
+        """
+        result = self.client.table("samples") \
+            .select("*,residues(*,eds_analyses(*))") \
+            .eq("sample_id", sample_id) \
+            .order("residue_number", foreign_table="residues") \
+            .execute()
         return result.data[0] if result.data else None
     
     # ================================================
@@ -144,60 +560,34 @@ class TaphoSpecDB:
         data = {k: v for k, v in data.items() if v is not None}
         
         result = self.client.table("residues").insert(data).execute()
+        self._ver["residues"] += 1
         return result.data[0] if result.data else None
     
-    def get_residues(self, sample_id: str = None, residue_id: str = None) -> List[Dict]:
-        """Get residues, optionally filtered"""
-        
-        query = self.client.table("residues").select("*")
-        
-        if residue_id:
-            query = query.eq("residue_id", residue_id)
-        elif sample_id:
-            query = query.eq("sample_id", sample_id)
-        
-        result = query.order("residue_number", desc=False).execute()
-        return result.data if result.data else []
+    def get_residues(self, sample_id: str = None, residue_id: str = None,
+                    columns: str = None) -> List[Dict]:
+        """Get residues, optionally filtered (cached for 60s)
+
+        List views get the summary projection by default; pass
+        columns="*" for the full visual_* description set.
+        """
+        return _cached_get_residues(self, self._url, sample_id, residue_id,
+                                    self._ver["residues"],
+                                    columns=columns or LIST_COLUMNS["residues"])
     
+    def bulk_create_residues(self, residues_data: List[Dict], parallel: bool = True) -> List[Dict]:
+        """Create multiple residues in chunked, concurrent inserts"""
+        created = self._bulk_insert("residues", residues_data, parallel=parallel)
+        self._ver["residues"] += 1
+        return created
+
     def get_residue_with_analyses(self, residue_id: str) -> Dict:
-        """Get residue with all its EDS analyses"""
-        
-        # Get residue info
-        residue_result = self.client.table("residues").select("*").eq("residue_id", residue_id).execute()
-        
-        if not residue_result.data:
-            return None
-        
-        residue = residue_result.data[0]
-        
-        # Get all EDS analyses for this residue
-        eds_result = self.client.table("eds_analyses").select("*").eq("residue_id", residue_id).order("analysis_point_number").execute()
-        
-        residue['eds_analyses'] = eds_result.data if eds_result.data else []
-        
-        return residue
-    
-    def get_sample_with_residues(self, sample_id: str) -> Dict:
-        """Get sample with all residues and their EDS analyses"""
-        
-        # Get sample
-        sample_result = self.client.table("samples").select("*").eq("sample_id", sample_id).execute()
-        
-        if not sample_result.data:
-            return None
-        
-        sample = sample_result.data[0]
-        
-        # Get residues
-        residues = self.get_residues(sample_id=sample_id)
-        
-        # Get EDS analyses for each residue
-        for residue in residues:
-            residue['eds_analyses'] = self.get_eds_by_residue(residue['residue_id'])
-        
-        sample['residues'] = residues
-        
-        return sample
+        """Get residue with all its EDS analyses (one embedded select)"""
+        result = self.client.table("residues") \
+            .select("*,eds_analyses(*)") \
+            .eq("residue_id", residue_id) \
+            .order("analysis_point_number", foreign_table="eds_analyses") \
+            .execute()
+        return result.data[0] if result.data else None
     
     # ================================================
     # EDS ANALYSIS (Updated for residue model)
@@ -210,10 +600,14 @@ class TaphoSpecDB:
                            si: float = None, mg: float = None, na: float = None,
                            s: float = None, cl: float = None, ti: float = None,
                            zn: float = None, ba: float = None, sr: float = None,
-                           classification: str = None, ca_p_ratio: float = None,
+                           classification: str = None,
                            analysis_date: str = None, analyst: str = None) -> Dict:
-        """Create new EDS analysis linked to a residue"""
-        
+        """Create new EDS analysis linked to a residue
+
+        ca_p_ratio is a generated column (see sql/eds_ca_p_generated.sql),
+        so Postgres computes it and the client never sends it.
+        """
+
         data = {
             "residue_id": residue_id,
             "analysis_point_number": analysis_point_number,
@@ -222,28 +616,102 @@ class TaphoSpecDB:
             "na": na, "s": s, "cl": cl, "ti": ti, "zn": zn,
             "ba": ba, "sr": sr,
             "classification": classification,
-            "ca_p_ratio": ca_p_ratio,
             "analysis_date": analysis_date,
             "analyst": analyst
         }
-        
-        # Calculate Ca/P ratio if both present
-        if ca is not None and p is not None and p > 0:
-            data['ca_p_ratio'] = ca / p
-        
+
         # Remove None values
         data = {k: v for k, v in data.items() if v is not None}
-        
+
         result = self.client.table("eds_analyses").insert(data).execute()
+        self._ver["eds_analyses"] += 1
         return result.data[0] if result.data else None
-    
-    def get_eds_analyses(self, residue_id: str = None, sample_id: str = None, 
-                        site_id: str = None) -> List[Dict]:
-        """Get EDS analyses, optionally filtered"""
-        
+
+    def bulk_create_eds_analyses_from_raw(self, residue_ids: List[str],
+                                         elemental_dicts: List[Dict],
+                                         metas: List[Dict] = None,
+                                         parallel: bool = True) -> List[Dict]:
+        """Bulk-create EDS analyses straight from raw elemental dicts
+
+        Normalizes each dict with normalize_elemental_data (any key casing)
+        and inserts everything through the chunked bulk path - one set of
+        round trips instead of a create_eds_analysis call per row. Ca/P is
+        computed server-side by the generated column.
+        """
+        if metas is None:
+            metas = [{}] * len(elemental_dicts)
+
+        rows = []
+        for residue_id, elemental, meta in zip(residue_ids, elemental_dicts, metas):
+            row = {col: val for col, val in normalize_elemental_data(elemental).items()
+                   if val is not None}
+            row["residue_id"] = residue_id
+            row.update({key: val for key, val in meta.items() if val is not None})
+            rows.append(row)
+
+        created = self._bulk_insert("eds_analyses", rows, parallel=parallel)
+        self._ver["eds_analyses"] += 1
+        return created
+
+    def import_eds_data_from_dataframe(self, site_id: str, df, sample_prefix: str = "SAMPLE",
+                                      parallel: bool = True) -> tuple:
+        """Import a DataFrame of EDS analyses in one bulk insert per table
+
+        Creates all samples, their default residues and all analyses in
+        three batched inserts instead of two round trips per row.
+        Analyses attach to residues in this schema, so each imported
+        sample gets a single residue carrying its analysis.
+        """
+        if df is None or len(df) == 0:
+            return (0, 0)
+
+        samples_payload = [{
+            "site_id": site_id,
+            "sample_code": f"{sample_prefix}_{i + 1:03d}",
+            "context": "Auto-imported from batch upload"
+        } for i in range(len(df))]
+        samples = self._bulk_insert("samples", samples_payload, parallel=parallel)
+        self._ver["samples"] += 1
+
+        residues_payload = [{"sample_id": sample["sample_id"], "residue_number": 1}
+                            for sample in samples]
+        residues = self.bulk_create_residues(residues_payload, parallel=parallel)
+
+        analyses = self.bulk_create_eds_analyses_from_raw(
+            [residue["residue_id"] for residue in residues],
+            df.to_dict(orient="records"),
+            parallel=parallel
+        )
+        return (len(samples), len(analyses))
+
+    def bulk_create_eds_analyses(self, analyses_data: List[Dict], parallel: bool = True) -> List[Dict]:
+        """Create multiple EDS analyses in chunked, concurrent inserts"""
+        created = self._bulk_insert("eds_analyses", analyses_data, parallel=parallel)
+        self._ver["eds_analyses"] += 1
+        return created
+
+    def get_eds_analyses(self, residue_id: str = None, sample_id: str = None,
+                        site_id: str = None, limit: int = 1000, offset: int = 0,
+                        created_before: str = None) -> List[Dict]:
+        """Get EDS analyses, optionally filtered (paginated and cached for 60s)
+
+        created_before is a keyset cursor (the created_at of the last
+        row seen): deep pages then skip OFFSET's scan-and-discard and
+        stay O(page) however far in they are. Use iter_eds_analyses to
+        stream everything.
+        """
+        return _cached_get_eds_analyses(self, self._url, residue_id, sample_id,
+                                        site_id, limit, offset, created_before,
+                                        self._ver["eds_analyses"])
+
+    def _fetch_eds_analyses(self, residue_id: str = None, sample_id: str = None,
+                            site_id: str = None, limit: int = 1000, offset: int = 0,
+                            created_before: str = None) -> List[Dict]:
+        """Uncached fetch behind _cached_get_eds_analyses"""
+
         if residue_id:
             # Direct query by residue
-            query = self.client.table("eds_analyses").select("*").eq("residue_id", residue_id)
+            query = self.client.table("eds_analyses").select(LIST_COLUMNS["eds_analyses"]).eq("residue_id", residue_id)
         elif site_id:
             # Use view for site filtering
             query = self.client.table("eds_complete").select("*").eq("site_id", site_id)
@@ -251,40 +719,754 @@ class TaphoSpecDB:
             # Get via residues
             residues = self.get_residues(sample_id=sample_id)
             residue_ids = [r['residue_id'] for r in residues]
-            
+
             if not residue_ids:
                 return []
-            
-            query = self.client.table("eds_analyses").select("*").in_("residue_id", residue_ids)
+
+            query = self.client.table("eds_analyses").select(LIST_COLUMNS["eds_analyses"]).in_("residue_id", residue_ids)
         else:
             # Get all
-            query = self.client.table("eds_analyses").select("*")
-        
-        result = query.order("created_at", desc=True).execute()
+            query = self.client.table("eds_analyses").select(LIST_COLUMNS["eds_analyses"])
+
+        query = query.order("created_at", desc=True)
+        if created_before:
+            result = query.lt("created_at", created_before).limit(limit).execute()
+        else:
+            result = query.range(offset, offset + limit - 1).execute()
         return result.data if result.data else []
+
+    def iter_eds_analyses(self, residue_id: str = None, sample_id: str = None,
+                         site_id: str = None, page_size: int = 1000):
+        """Iterate over all EDS analyses in page_size batches"""
+        offset = 0
+        while True:
+            page = self.get_eds_analyses(residue_id=residue_id, sample_id=sample_id,
+                                         site_id=site_id, limit=page_size, offset=offset)
+            if not page:
+                break
+            yield page
+            if len(page) < page_size:
+                break
+            offset += page_size
     
     def get_eds_by_residue(self, residue_id: str) -> List[Dict]:
         """Get all EDS analyses for a specific residue"""
-        
+
         result = self.client.table("eds_analyses").select("*").eq("residue_id", residue_id).order("analysis_point_number").execute()
-        
+
+        return result.data if result.data else []
+
+    def get_unlinked_eds_analyses(self, limit: int = 1000) -> List[Dict]:
+        """Get EDS analyses not yet linked to a library entry
+
+        Calls the unlinked_eds_analyses RPC (see sql/), an anti-join on
+        spectral_library.eds_spectrum_id, instead of fetching every
+        analysis plus the whole library and differencing in Python.
+        """
+        result = self.client.rpc("unlinked_eds_analyses", {"max_rows": limit}).execute()
+        return result.data if result.data else []
+
+    def get_eds_site_summary(self, site_id: str) -> Dict:
+        """Get aggregate EDS statistics for a site
+
+        Calls the eds_site_summary RPC (see sql/), which computes
+        residue/analysis counts and element means server-side in one
+        pass, so dashboards don't pull every raw row over the wire.
+        """
+        result = self.client.rpc("eds_site_summary", {"p_site_id": site_id}).execute()
+
+        if not result.data:
+            return {}
+        return result.data[0] if isinstance(result.data, list) else result.data
+
+    # ================================================
+    # EXPERIMENTAL SAMPLES (v2.5)
+    # ================================================
+
+    def get_degradation_series(self, base_experiment_id: str) -> List[Dict]:
+        """Get an experiment and its full degradation lineage
+
+        Calls the get_degradation_series RPC (see sql/), which walks
+        parent_experiment_id with a recursive CTE and returns the lineage
+        ordered by treatment_sequence - only the matching rows are
+        transferred, not the whole experimental_samples table.
+        """
+        result = self.client.rpc('get_degradation_series',
+                                 {'root': base_experiment_id}).execute()
+        return result.data if result.data else []
+
+    def create_sequential_experiment(self, parent_experiment_id: str, treatment: str,
+                                    treatment_description: str = None) -> Optional[Dict]:
+        """Create the next experiment in a degradation series
+
+        The create_sequential_experiment RPC (see sql/) reads the parent
+        row and inserts the child in one atomic statement, so there is
+        no fetch-parent round-trip and no race on the sequence number.
+        """
+        params = {'p_parent': parent_experiment_id, 'p_treatment': treatment}
+        if treatment_description:
+            params['p_desc'] = treatment_description
+
+        result = self.client.rpc('create_sequential_experiment', params).execute()
+        return result.data[0] if isinstance(result.data, list) and result.data else result.data
+
+    # ================================================
+    # SPECTRAL LIBRARY (v2.5)
+    # ================================================
+
+    def _refresh_library_mvs(self) -> None:
+        """Refresh the library materialized views after a write
+
+        Calls the refresh_library_mvs RPC (see sql/) so the rerun that
+        follows a create/update/delete reads the change instead of a
+        stale MV; without this the views only refresh if the optional
+        pg_cron drain is enabled. Library writes are rare enough that
+        the inline refresh cost doesn't matter.
+        """
+        self.client.rpc("refresh_library_mvs", {}).execute()
+
+    def create_library_entry(self, spectrum_name: str, **kwargs) -> Dict:
+        """Create or update a library entry in one statement
+
+        Upserts on spectrum_name (UNIQUE, see sql/spectral_library_upsert.sql)
+        so importers never need a check-then-insert round trip.
+        """
+        data = {"spectrum_name": spectrum_name, **kwargs}
+        data = {k: v for k, v in data.items() if v is not None}
+        if data.get("keywords"):
+            # Stored lowercased so keyword search stays a pure indexed
+            # array overlap (see sql/search_library_keywords.sql)
+            data["keywords"] = [k.lower() for k in data["keywords"]]
+
+        result = self.client.table("spectral_library") \
+            .upsert(data, on_conflict="spectrum_name").execute()
+        self._refresh_library_mvs()
+        self._ver["spectral_library"] += 1
+        self._lib_cache.clear()
+        return result.data[0] if result.data else None
+
+    def update_library_entry(self, library_id: str, updates: Dict) -> Optional[Dict]:
+        """Update a library entry and invalidate only library caches
+
+        Bumping the spectral_library version counter makes stale cached
+        listings unreachable immediately; caches keyed on other tables
+        stay warm.
+        """
+        if updates.get("keywords"):
+            updates = {**updates, "keywords": [k.lower() for k in updates["keywords"]]}
+
+        result = self.client.table("spectral_library") \
+            .update(updates).eq("library_id", library_id).execute()
+        self._refresh_library_mvs()
+        self._ver["spectral_library"] += 1
+        self._lib_cache.clear()
+        return result.data[0] if result.data else None
+
+    def delete_library_entry(self, library_id: str) -> None:
+        """Delete a library entry and invalidate only library caches"""
+        self.client.table("spectral_library") \
+            .delete().eq("library_id", library_id).execute()
+        self._refresh_library_mvs()
+        self._ver["spectral_library"] += 1
+        self._lib_cache.clear()
+
+    def bulk_upsert_library_entries(self, entries_data: List[Dict], parallel: bool = True) -> List[Dict]:
+        """Upsert many library entries (CSV imports) in chunked, concurrent statements"""
+        created = self._bulk_insert("spectral_library", entries_data, parallel=parallel,
+                                    upsert_on="spectrum_name")
+        self._refresh_library_mvs()
+        self._ver["spectral_library"] += 1
+        self._lib_cache.clear()
+        return created
+
+    def get_library_entries(self, spectrum_type: str = None, material_type: str = None,
+                           verified_only: bool = False, multimodal_only: bool = False,
+                           limit: int = 1000, offset: int = 0,
+                           include_spectra: bool = False,
+                           columns: str = None,
+                           spectrum_types: List[str] = None,
+                           material_types: List[str] = None,
+                           require_eds: bool = False) -> List[Dict]:
+        """Get library entries with their EDS/FTIR data, optionally filtered
+
+        Reads library_complete_mv (see sql/library_materialized_views.sql),
+        a materialized join refreshed after library writes, so listing the
+        library never re-runs the join/aggregate. The raw FTIR spectrum
+        blob is only fetched with include_spectra=True. Results are
+        cached for 60s and invalidated by library writes. Callers that
+        need only a few fields can pass a narrower columns projection;
+        multi-value filters (spectrum_types/material_types/require_eds)
+        become indexed WHERE clauses instead of Python post-filters.
+        """
+        return _cached_get_library_entries(self, self._url, spectrum_type,
+                                           material_type, verified_only,
+                                           multimodal_only, limit, offset,
+                                           include_spectra, columns,
+                                           tuple(spectrum_types) if spectrum_types else None,
+                                           tuple(material_types) if material_types else None,
+                                           require_eds,
+                                           self._ver["spectral_library"])
+
+    def get_all_library_entries(self, page_size: int = 1000, **filters) -> List[Dict]:
+        """Fetch every matching library entry in page_size batches
+
+        get_library_entries caps at its limit (default 1000), which
+        would silently truncate search matrices once the library grows
+        past it; this pages until a short batch, iter_samples-style.
+        """
+        entries = []
+        offset = 0
+        while True:
+            page = self.get_library_entries(limit=page_size, offset=offset, **filters)
+            entries.extend(page)
+            if len(page) < page_size:
+                return entries
+            offset += page_size
+
+    def search_library_vector(self, query_spectrum: Dict, top_n: int = 20,
+                             spectrum_type: str = None) -> List[Dict]:
+        """Top-N library search via the pgvector HNSW index
+
+        Sends the 16-element fingerprint to the search_library_vec RPC
+        (see sql/spectral_library_pgvector.sql), which ranks with the
+        indexed L2 operator server-side and returns only the best rows.
+        The in-process matrix kernels remain for ad-hoc metrics.
+        """
+        q = [float(query_spectrum.get(col) or 0) for col in _ELEMENT_COLS]
+        params = {'q': q, 'top_n': top_n}
+        if spectrum_type:
+            params['p_spectrum_type'] = spectrum_type
+
+        result = self.client.rpc('search_library_vec', params).execute()
+        return result.data if result.data else []
+
+    def get_library_matrix(self, elements: List[str], prefix: str = "eds_"):
+        """Get (ids, matrix, norms) for the whole library, cached in-process
+
+        Distance searches otherwise rebuild the matrix from entry dicts
+        on every call. The matrix and per-row norms (reused as the
+        cosine denominators) are built once per element set and the
+        cache is cleared by library writes.
+        """
+        key = tuple(e.lower() for e in elements)
+        cached = self._lib_cache.get(key)
+        if cached is None:
+            entries = self.get_all_library_entries()
+            ids, M = build_library_index(entries, list(key), prefix=prefix)
+            cached = (ids, M, np.linalg.norm(M, axis=1).astype(np.float32, copy=False))
+            self._lib_cache[key] = cached
+        return cached
+
+    def get_library_statistics(self) -> Dict:
+        """Get aggregate library statistics (precomputed in library_statistics_mv, cached)"""
+        return _cached_library_statistics(self, self._url, self._ver["spectral_library"])
+
+    @property
+    def library_version(self) -> int:
+        """Write counter for the spectral library
+
+        Pages mix this into their own st.cache_data keys so library
+        mutations invalidate derived caches (e.g. prebuilt search
+        matrices) the same way the internal listing caches refresh.
+        """
+        return self._ver["spectral_library"]
+
+    def library_signature(self) -> str:
+        """Durable write signature for the spectral library
+
+        Unlike library_version (an in-process counter that resets on
+        restart), this probes the table itself - row count plus the
+        newest updated_at (see sql/updated_at_trigger.sql) - so caches
+        persisted to disk or shared across workers can tell whether the
+        library changed. One cheap indexed round-trip.
+        """
+        result = self.client.table("spectral_library") \
+            .select("updated_at", count="exact") \
+            .order("updated_at", desc=True).limit(1).execute()
+        latest = result.data[0].get("updated_at", "") if result.data else ""
+        return f"{result.count}:{latest}"
+
+    def get_material_type_counts(self) -> List[Dict]:
+        """Get per-material-type entry counts, aggregated server-side
+
+        Calls the material_type_counts RPC (see sql/) - one GROUP BY in
+        Postgres instead of fetching every entry and counting in Python.
+        """
+        result = self.client.rpc("material_type_counts", {}).execute()
+        return result.data if result.data else []
+
+    def search_library_by_keywords(self, keywords: List[str]) -> List[Dict]:
+        """Search library entries by keywords (server-side, GIN-indexed)
+
+        Calls the search_library_keywords RPC (see sql/) which runs an
+        indexed array-overlap match, so only matching rows come back over
+        the network instead of the whole table.
+        """
+        kws = sorted({k.strip().lower() for k in keywords if k and k.strip()})
+        if not kws:
+            return []
+
+        result = self.client.rpc('search_library_keywords', {'kws': kws}).execute()
         return result.data if result.data else []
 
+    # ================================================
+    # MULTI-MODAL ANALYSIS (v2.5)
+    # ================================================
+
+    # ================================================
+    # SEARCH LOGGING (v2.5)
+    # ================================================
+
+    def _ensure_log_writer(self):
+        """Start the search-log writer thread on first use"""
+        if self._log_thread is None or not self._log_thread.is_alive():
+            self._log_thread = threading.Thread(target=self._drain_log_queue, daemon=True)
+            self._log_thread.start()
+            atexit.register(self._flush_search_log)
+
+    def _flush_search_log(self):
+        """Write whatever is still queued in one insert (shutdown hook)
+
+        The daemon writer dies with the process, so without this any
+        rows queued in the last flush window would be lost.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            try:
+                self.client.table("library_searches").insert(batch).execute()
+            except Exception:
+                pass
+
+    def _drain_log_queue(self):
+        """Write queued search-log rows in batches, off the request path"""
+        while True:
+            batch = [self._log_queue.get()]
+            deadline = time.monotonic() + _LOG_FLUSH_SECS
+            while len(batch) < _LOG_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._log_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.client.table("library_searches").insert(batch).execute()
+            except Exception:
+                # Logging must never break a search
+                pass
+
+    def log_library_search(self, query_spectrum_id: str, query_type: str,
+                          search_params: Dict, results: List[Dict],
+                          user_id: str = None) -> Dict:
+        """Queue a search-log row and return its id immediately
+
+        The INSERT (which carries the full results blob) happens on the
+        background writer, so logging adds no user-visible latency. The
+        search_id is generated client-side so feedback updates can
+        reference it before the row lands.
+        """
+        row = {
+            "search_id": str(uuid.uuid4()),
+            "query_spectrum_id": query_spectrum_id,
+            "query_type": query_type,
+            "search_params": search_params,
+            "results": results,
+            "user_id": user_id,
+            "search_date": datetime.now(timezone.utc).isoformat()
+        }
+        row = {k: v for k, v in row.items() if v is not None}
+
+        self._ensure_log_writer()
+        self._log_queue.put(row)
+        return {"search_id": row["search_id"]}
+
+    def log_and_accept_library_search(self, query_spectrum_id: str, query_type: str,
+                                      search_params: Dict, results: List[Dict],
+                                      selected_id: str, feedback: str = None,
+                                      user_id: str = None) -> Dict:
+        """Log a search together with its acceptance as one queued insert
+
+        Acceptance is already known when the user clicks accept, so the
+        feedback columns ride along on the log row instead of a second
+        UPDATE round-trip - one insert, atomic by construction.
+        """
+        row = {
+            "search_id": str(uuid.uuid4()),
+            "query_spectrum_id": query_spectrum_id,
+            "query_type": query_type,
+            "search_params": search_params,
+            "results": results,
+            "accepted": True,
+            "selected_id": selected_id,
+            "feedback": feedback,
+            "user_id": user_id,
+            "search_date": datetime.now(timezone.utc).isoformat()
+        }
+        row = {k: v for k, v in row.items() if v is not None}
+
+        self._ensure_log_writer()
+        self._log_queue.put(row)
+        return {"search_id": row["search_id"]}
+
+    def get_search_history(self, user_id: str = None, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """Get logged searches (paginated, newest first)
+
+        Projects only the columns the history view renders - the full
+        results blob stays in the database.
+        """
+        query = self.client.table("library_searches") \
+            .select("search_id,query_spectrum_id,query_type,search_params,"
+                    "accepted,selected_id,feedback,search_date")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        result = query.order("search_date", desc=True).range(offset, offset + limit - 1).execute()
+        return result.data if result.data else []
+
+    def get_search_stats(self) -> Dict:
+        """Get aggregate search-log counts in one round-trip
+
+        The library_search_stats RPC (see sql/) aggregates server-side,
+        so the dashboard never streams the whole history.
+        """
+        result = self.client.rpc('library_search_stats').execute()
+        return result.data if result.data else {}
+
+    def get_conflicting_multimodal_analyses(self) -> List[Dict]:
+        """Get multimodal links where EDS and FTIR disagree
+
+        The agreement_level filter is served by a partial index (see
+        sql/multimodal_conflict_index.sql), and only the columns the
+        conflict review UI shows are fetched.
+        """
+        result = self.client.table("multimodal_summary") \
+            .select("link_id,eds_classification,ftir_classification,agreement_level,created_at") \
+            .eq("agreement_level", "conflict") \
+            .execute()
+        return result.data if result.data else []
+
+    def bulk_set_multimodal_classifications(self, classifications: List[Dict]) -> None:
+        """Apply many multimodal classifications in one statement
+
+        Each dict carries link_id, classification, confidence_score,
+        agreement_level and reasoning; the bulk_set_multimodal RPC (see
+        sql/) updates all links from the array instead of one UPDATE
+        round-trip per link.
+        """
+        if not classifications:
+            return
+
+        self.client.rpc('bulk_set_multimodal', {'payloads': classifications}).execute()
+
+
+# ================================================
+# SPECTRAL DISTANCE FUNCTIONS
+# ================================================
+
+# Quantized matrices store percentages as int16 hundredths (0.01%
+# resolution covers EDS precision), halving the memory traffic of the
+# bandwidth-bound distance scans.
+_QUANT_SCALE = 100.0
+
+
+def build_library_matrix(entries: List[Dict], elements: List[str], prefix: str = "eds_",
+                         quantize: bool = False) -> "np.ndarray":
+    """Build an (N, n_elements) matrix from library entry dicts
+
+    Built once per search so distance scoring runs as a single NumPy
+    matrix operation instead of N per-entry dict walks. With
+    quantize=True the matrix is int16 hundredths of a percent, halving
+    its footprint.
+    """
+    cols = [prefix + e.lower() for e in elements]
+    if not entries:
+        # Keep the (0, D) shape so axis-1 reductions downstream still work
+        return np.empty((0, len(cols)), dtype=np.int16 if quantize else np.float32)
+    # None becomes NaN in the float cast, then one vectorized nan_to_num
+    # replaces the per-cell "or 0" truthiness check (N x D Python branches)
+    M = np.ascontiguousarray(
+        [[entry.get(col) for col in cols] for entry in entries],
+        dtype=np.float32)
+    np.nan_to_num(M, copy=False, nan=0.0)
+    if quantize:
+        return np.round(M * _QUANT_SCALE).astype(np.int16)
+    return M
+
+
+def build_library_index(entries: List[Dict], elements: List[str], prefix: str = "eds_",
+                        quantize: bool = False):
+    """Build (ids, matrix) for batch scoring
+
+    Pairs each matrix row with its library_id so callers can map the
+    distance vector back to entries without re-walking the dicts.
+    """
+    ids = [entry.get('library_id') for entry in entries]
+    return ids, build_library_matrix(entries, elements, prefix=prefix, quantize=quantize)
+
+
+def build_query_vector(spectrum: Dict, elements: List[str],
+                       quantize: bool = False) -> "np.ndarray":
+    """Build a vector from a query spectrum dict (lowercase element keys)"""
+    q = np.asarray([spectrum.get(e.lower()) or 0 for e in elements], dtype=np.float32)
+    if quantize:
+        return np.round(q * _QUANT_SCALE).astype(np.int16)
+    return q
+
+
+# The chi-square and cosine expressions below allocate a temporary array
+# per operation, so NumPy makes several passes over M. The Numba kernels
+# fuse each metric into one pass per row, which matters once the library
+# matrix outgrows cache; below the row gate NumPy wins on JIT overhead.
+_NUMBA_MIN_ROWS = 10_000
+
+if NUMBA_AVAILABLE:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _chi2_batch(M, q):
+        n_rows, n_cols = M.shape
+        out = np.empty(n_rows, np.float32)
+        for i in numba.prange(n_rows):
+            acc = 0.0
+            for j in range(n_cols):
+                a = M[i, j] + 1e-10
+                b = q[j] + 1e-10
+                d = a - b
+                acc += d * d / (a + b)
+            out[i] = acc
+        return out
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _euclidean_batch(M, q):
+        n_rows, n_cols = M.shape
+        out = np.empty(n_rows, np.float32)
+        for i in numba.prange(n_rows):
+            acc = 0.0
+            for j in range(n_cols):
+                d = M[i, j] - q[j]
+                acc += d * d
+            out[i] = np.sqrt(acc)
+        return out
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _manhattan_batch(M, q):
+        n_rows, n_cols = M.shape
+        out = np.empty(n_rows, np.float32)
+        for i in numba.prange(n_rows):
+            acc = 0.0
+            for j in range(n_cols):
+                acc += abs(M[i, j] - q[j])
+            out[i] = acc
+        return out
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_batch(M, q):
+        n_rows, n_cols = M.shape
+        out = np.empty(n_rows, np.float32)
+        for i in numba.prange(n_rows):
+            dot = 0.0
+            norm_m = 0.0
+            norm_q = 0.0
+            for j in range(n_cols):
+                dot += M[i, j] * q[j]
+                norm_m += M[i, j] * M[i, j]
+                norm_q += q[j] * q[j]
+            denom = np.sqrt(norm_m) * np.sqrt(norm_q)
+            out[i] = 1.0 - dot / denom if denom > 0 else 1.0
+        return out
+
+
+def _euclidean_dist(M, q, norms_sq=None):
+    if NUMBA_AVAILABLE and M.shape[0] >= _NUMBA_MIN_ROWS:
+        return _euclidean_batch(M, q)
+    if norms_sq is not None:
+        # ||m - q||^2 = ||m||^2 + ||q||^2 - 2 m.q: one BLAS matvec plus
+        # the cached row norms, no (N, D) difference temporary
+        d2 = norms_sq + float(q @ q) - 2.0 * (M @ q)
+        np.maximum(d2, 0, out=d2)
+        return np.sqrt(d2, out=d2)
+    return np.linalg.norm(M - q, axis=1)
+
+
+def _manhattan_dist(M, q, norms_sq=None):
+    if NUMBA_AVAILABLE and M.shape[0] >= _NUMBA_MIN_ROWS:
+        return _manhattan_batch(M, q)
+    # In-place abs: one temporary instead of two
+    diff = M - q
+    np.abs(diff, out=diff)
+    return diff.sum(axis=1)
+
+
+def _cosine_dist(M, q, norms_sq=None):
+    if NUMBA_AVAILABLE and M.shape[0] >= _NUMBA_MIN_ROWS:
+        return _cosine_batch(M, q)
+    row_norms = np.sqrt(norms_sq) if norms_sq is not None else np.linalg.norm(M, axis=1)
+    denom = row_norms * np.linalg.norm(q)
+    sim = (M @ q) / np.where(denom > 0, denom, 1)
+    return 1.0 - sim
+
+
+def _chi_square_dist(M, q, norms_sq=None):
+    if NUMBA_AVAILABLE and M.shape[0] >= _NUMBA_MIN_ROWS:
+        return _chi2_batch(M, q)
+    # In-place ops: two buffers instead of a temporary per operation
+    diff = M - q
+    np.square(diff, out=diff)
+    denom = M + q
+    denom += 1e-10
+    diff /= denom
+    return diff.sum(axis=1)
+
+
+def _euclidean_dist_q(Mi, qi):
+    sq = ((Mi - qi) ** 2).sum(axis=1, dtype=np.int64)
+    return np.sqrt(sq).astype(np.float32) / np.float32(_QUANT_SCALE)
+
+
+def _manhattan_dist_q(Mi, qi):
+    s = np.abs(Mi - qi).sum(axis=1, dtype=np.int64)
+    return s.astype(np.float32) / np.float32(_QUANT_SCALE)
+
+
+def _cosine_dist_q(Mi, qi):
+    # The quantization scale cancels in the dot/norm ratio
+    dot = (Mi @ qi).astype(np.float32)
+    denom = np.sqrt((Mi * Mi).sum(axis=1).astype(np.float32)) * np.float32(np.sqrt(qi @ qi))
+    return 1.0 - dot / np.where(denom > 0, denom, 1)
+
+
+# Metric name -> kernel, resolved with one hash lookup per search
+# instead of an if/elif walk per call. chi_square has no integer
+# kernel (the per-element divide doesn't cancel the scale), so the
+# dispatcher dequantizes and uses the float path.
+_METRIC_DISPATCH = {
+    'euclidean': _euclidean_dist,
+    'manhattan': _manhattan_dist,
+    'cosine': _cosine_dist,
+    'chi_square': _chi_square_dist,
+}
+
+_QUANT_DISPATCH = {
+    'euclidean': _euclidean_dist_q,
+    'manhattan': _manhattan_dist_q,
+    'cosine': _cosine_dist_q,
+}
+
+
+def calculate_distances_matrix(M: "np.ndarray", q: "np.ndarray", metric: str = 'euclidean',
+                               row_norms_sq: "np.ndarray" = None) -> "np.ndarray":
+    """Distances between every row of library matrix M and query vector q
+
+    Accepts the quantized int16 matrices from build_library_matrix;
+    results always come back in percent units. Callers that search the
+    same matrix repeatedly can pass row_norms_sq ((M * M).sum(axis=1),
+    computed once) so euclidean and cosine reduce to a single matvec.
+    """
+    if metric not in _METRIC_DISPATCH:
+        raise ValueError(f"Unknown distance metric: {metric}")
+
+    if M.dtype == np.int16:
+        kernel = _QUANT_DISPATCH.get(metric)
+        if kernel is not None:
+            return kernel(M.astype(np.int32), q.astype(np.int32))
+        M = M.astype(np.float32) / np.float32(_QUANT_SCALE)
+        q = q.astype(np.float32) / np.float32(_QUANT_SCALE)
+        row_norms_sq = None
+
+    return _METRIC_DISPATCH[metric](M, q, row_norms_sq)
+
+
+def calculate_distance(query_spectrum: Dict, library_entry: Dict,
+                      elements: List[str], metric: str = 'euclidean') -> float:
+    """Distance between one query spectrum and one library entry"""
+    M = build_library_matrix([library_entry], elements)
+    q = build_query_vector(query_spectrum, elements)
+    return float(calculate_distances_matrix(M, q, metric)[0])
+
+
+# ================================================
+# DATASET FLATTENING
+# ================================================
+
+def eds_analyses_to_dataframe(records: List[Dict]):
+    """Build a DataFrame from EDS analysis rows with explicit dtypes
+
+    pd.DataFrame(list_of_dicts) infers dtypes row by row and lands the
+    16 element columns as object/float64; building each column with
+    np.fromiter keeps them float32 from the start, so downstream NumPy
+    scoring takes the arrays without another conversion pass.
+    """
+    import pandas as pd
+
+    n = len(records)
+    numeric = _ELEMENT_COLS + ('ca_p_ratio',)
+    cols = {}
+    for key in ('analysis_id', 'residue_id', 'analysis_point_number', 'classification'):
+        if n and key in records[0]:
+            cols[key] = [r.get(key) for r in records]
+    for key in numeric:
+        cols[key] = np.fromiter(
+            (r.get(key) if r.get(key) is not None else np.nan for r in records),
+            dtype=np.float32, count=n)
+    return pd.DataFrame(cols)
+
+
+def site_dataset_to_dataframe(site_rows: List[Dict]):
+    """Flatten get_site_dataset() output to one row per EDS analysis
+
+    Each analysis row carries its site/sample/residue context so the
+    frame can be fed straight into authenticate_with_context.
+    """
+    import pandas as pd
+
+    records = []
+    for site in site_rows:
+        for sample in site.get('samples') or []:
+            for residue in sample.get('residues') or []:
+                for analysis in residue.get('eds_analyses') or []:
+                    row = dict(analysis)
+                    row['site_id'] = site.get('site_id')
+                    row['site_name'] = site.get('site_name')
+                    row['context_type'] = site.get('context_type')
+                    row['sample_id'] = sample.get('sample_id')
+                    row['sample_code'] = sample.get('sample_code')
+                    row['residue_number'] = residue.get('residue_number')
+                    records.append(row)
+
+    return pd.DataFrame(records)
+
 
 # ================================================
 # CONNECTION HELPER
 # ================================================
 
+def _resolve_secret(name: str) -> Optional[str]:
+    """Resolve a credential from the environment, falling back to secrets"""
+    value = os.environ.get(name)
+    if value:
+        return value
+    try:
+        return st.secrets.get(name)
+    except FileNotFoundError:
+        return None
+
+
+# Resolved once at import so every cache miss (and every worker cold
+# start) reuses the same values instead of re-parsing the secrets TOML
+_SUPABASE_URL = _resolve_secret("SUPABASE_URL")
+_SUPABASE_KEY = _resolve_secret("SUPABASE_KEY")
+
+
 @st.cache_resource
 def get_db_connection():
     """Get database connection (cached)"""
-    supabase_url = os.getenv("SUPABASE_URL") or st.secrets.get("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY") or st.secrets.get("SUPABASE_KEY")
-    
-    if not supabase_url or not supabase_key:
+    if _SUPABASE_URL is None or _SUPABASE_KEY is None:
         raise ValueError("Supabase credentials not found. Set SUPABASE_URL and SUPABASE_KEY in secrets.")
-    
-    return TaphoSpecDB(supabase_url, supabase_key)
+
+    return TaphoSpecDB(_SUPABASE_URL, _SUPABASE_KEY)
 
 
 def init_session_state_db():
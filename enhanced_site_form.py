@@ -3,6 +3,56 @@
 # Add this to your Sites page in app.py
 # ================================================
 
+# Hoisted so reruns don't rebuild these literals per call
+_CONTEXT_DESCRIPTIONS = {
+    "cave_guano": "High P (3-20%), Mn indicator for bat guano",
+    "cave_carbonate": "High Ca, moderate P (0.5-3%)",
+    "open_air_sand": "Low P (<2%), Si contamination",
+    "peat_bog": "Very low P, excellent organic preservation"
+}
+_DEFAULT_CONTEXT_DESCRIPTION = "See literature for expected signatures"
+
+# Selectbox option sets, hoisted as tuples so reruns reuse one object
+# instead of re-allocating a list per widget per keystroke
+_CLIMATE_ZONES = ("Tropical", "Subtropical", "Temperate", "Mediterranean",
+                  "Arid/Semi-arid", "Arctic/Sub-arctic")
+_RAINFALL_REGIMES = ("Humid (>1000mm/yr)", "Moderate (500-1000mm/yr)",
+                     "Dry (<500mm/yr)", "Variable/Seasonal", "Unknown")
+_TEMPERATURE_REGIMES = ("Tropical (>25°C mean)", "Warm temperate (15-25°C)",
+                        "Cool temperate (5-15°C)", "Cold (<5°C mean)",
+                        "Variable/Seasonal")
+_CONTEXT_TYPES = ("cave_guano", "cave_carbonate", "cave_other", "rockshelter",
+                  "open_air_sand", "open_air_clay", "open_air_loess",
+                  "peat_bog", "volcanic_ash", "other")
+_PH_CONDITIONS = ("Strongly Acidic (pH <4)", "Acidic (pH 4-6)", "Neutral (pH 6-8)",
+                  "Alkaline (pH 8-10)", "Strongly Alkaline (pH >10)",
+                  "Variable", "Unknown")
+_WATER_REGIMES = ("Permanently Saturated", "Seasonally Saturated", "Seasonally Wet",
+                  "Well-Drained", "Arid/Dry", "Unknown")
+_MICROBIAL_LEVELS = ("Very High", "High", "Moderate", "Low",
+                     "Very Low/Sterile", "Unknown")
+_PRESERVATION_LEVELS = ("Very Poor", "Poor", "Fair", "Good", "Excellent")
+_CONFIDENCE_LEVELS = ("High", "Medium", "Low")
+
+_CONTEXT_TYPE_LABELS = {
+    "cave_guano": "🦇 Cave (Guano-Rich)",
+    "cave_carbonate": "🪨 Cave (Carbonate-Rich)",
+    "cave_other": "🕳️ Cave (Other)",
+    "rockshelter": "🏔️ Rockshelter",
+    "open_air_sand": "🏖️ Open-Air (Sand/Sandstone)",
+    "open_air_clay": "🧱 Open-Air (Clay/Silt)",
+    "open_air_loess": "🌾 Open-Air (Loess)",
+    "peat_bog": "🌿 Peat Bog",
+    "volcanic_ash": "🌋 Volcanic Ash",
+    "other": "❓ Other"
+}
+
+
+def _fmt_context_type(value):
+    """Selectbox format_func, defined once instead of per rerun"""
+    return _CONTEXT_TYPE_LABELS.get(value, value)
+
+
 def render_enhanced_site_form(db):
     """Enhanced site registration form with full taphonomic context"""
     
@@ -60,39 +110,20 @@ def render_enhanced_site_form(db):
             with col1:
                 climate_zone = st.selectbox(
                     "Climate Zone*",
-                    [
-                        "Tropical",
-                        "Subtropical", 
-                        "Temperate",
-                        "Mediterranean",
-                        "Arid/Semi-arid",
-                        "Arctic/Sub-arctic"
-                    ],
+                    _CLIMATE_ZONES,
                     help="Affects preservation potential"
                 )
             
             with col2:
                 rainfall_regime = st.selectbox(
                     "Rainfall Regime",
-                    [
-                        "Humid (>1000mm/yr)",
-                        "Moderate (500-1000mm/yr)",
-                        "Dry (<500mm/yr)",
-                        "Variable/Seasonal",
-                        "Unknown"
-                    ]
+                    _RAINFALL_REGIMES
                 )
             
             with col3:
                 temperature_regime = st.selectbox(
                     "Temperature Regime",
-                    [
-                        "Tropical (>25°C mean)",
-                        "Warm temperate (15-25°C)",
-                        "Cool temperate (5-15°C)",
-                        "Cold (<5°C mean)",
-                        "Variable/Seasonal"
-                    ]
+                    _TEMPERATURE_REGIMES
                 )
             
             st.markdown("---")
@@ -104,30 +135,8 @@ def render_enhanced_site_form(db):
             with col1:
                 context_type = st.selectbox(
                     "Primary Depositional Context*",
-                    [
-                        "cave_guano",
-                        "cave_carbonate",
-                        "cave_other",
-                        "rockshelter",
-                        "open_air_sand",
-                        "open_air_clay",
-                        "open_air_loess",
-                        "peat_bog",
-                        "volcanic_ash",
-                        "other"
-                    ],
-                    format_func=lambda x: {
-                        "cave_guano": "🦇 Cave (Guano-Rich)",
-                        "cave_carbonate": "🪨 Cave (Carbonate-Rich)",
-                        "cave_other": "🕳️ Cave (Other)",
-                        "rockshelter": "🏔️ Rockshelter",
-                        "open_air_sand": "🏖️ Open-Air (Sand/Sandstone)",
-                        "open_air_clay": "🧱 Open-Air (Clay/Silt)",
-                        "open_air_loess": "🌾 Open-Air (Loess)",
-                        "peat_bog": "🌿 Peat Bog",
-                        "volcanic_ash": "🌋 Volcanic Ash",
-                        "other": "❓ Other"
-                    }.get(x, x),
+                    _CONTEXT_TYPES,
+                    format_func=_fmt_context_type,
                     help="Select the depositional environment"
                 )
                 
@@ -150,43 +159,21 @@ def render_enhanced_site_form(db):
             with col1:
                 ph_condition = st.selectbox(
                     "pH Conditions",
-                    [
-                        "Strongly Acidic (pH <4)",
-                        "Acidic (pH 4-6)",
-                        "Neutral (pH 6-8)",
-                        "Alkaline (pH 8-10)",
-                        "Strongly Alkaline (pH >10)",
-                        "Variable",
-                        "Unknown"
-                    ],
+                    _PH_CONDITIONS,
                     help="Affects mineral/organic preservation"
                 )
             
             with col2:
                 water_table = st.selectbox(
                     "Water Regime",
-                    [
-                        "Permanently Saturated",
-                        "Seasonally Saturated",
-                        "Seasonally Wet",
-                        "Well-Drained",
-                        "Arid/Dry",
-                        "Unknown"
-                    ],
+                    _WATER_REGIMES,
                     help="Waterlogging affects preservation"
                 )
             
             with col3:
                 microbial_activity = st.selectbox(
                     "Microbial Activity",
-                    [
-                        "Very High",
-                        "High",
-                        "Moderate",
-                        "Low",
-                        "Very Low/Sterile",
-                        "Unknown"
-                    ],
+                    _MICROBIAL_LEVELS,
                     help="Affects organic decay rates"
                 )
             
@@ -217,7 +204,7 @@ def render_enhanced_site_form(db):
             with col1:
                 organic_preservation = st.select_slider(
                     "Organic Preservation Potential",
-                    options=["Very Poor", "Poor", "Fair", "Good", "Excellent"],
+                    options=_PRESERVATION_LEVELS,
                     value="Fair",
                     help="Expected preservation of organic residues"
                 )
@@ -225,7 +212,7 @@ def render_enhanced_site_form(db):
             with col2:
                 mineral_preservation = st.select_slider(
                     "Mineral Preservation Potential",
-                    options=["Very Poor", "Poor", "Fair", "Good", "Excellent"],
+                    options=_PRESERVATION_LEVELS,
                     value="Fair",
                     help="Expected preservation of mineral residues"
                 )
@@ -267,7 +254,7 @@ def render_enhanced_site_form(db):
             with col2:
                 context_confidence = st.selectbox(
                     "Context Characterization Confidence",
-                    ["High", "Medium", "Low"],
+                    _CONFIDENCE_LEVELS,
                     help="How well is the site context understood?"
                 )
             
@@ -283,114 +270,66 @@ def render_enhanced_site_form(db):
             submitted = st.form_submit_button("✅ Register Site with Full Context", type="primary")
             
             if submitted and site_name and country:
-                try:
-                    # Create default project if needed
-                    projects = db.get_projects()
-                    if not projects or len(projects) == 0:
-                        default_project = db.create_project(
-                            project_name="Default Project",
-                            description="Auto-created"
-                        )
-                        project_id = default_project['project_id']
-                    else:
-                        project_id = projects[0]['project_id']
+                # Idempotency key: a double-clicked submit on a slow
+                # network fires two reruns; skip the second identical write
+                import hashlib
+                write_key = hashlib.blake2b(
+                    f"{site_name}|{country}|{latitude}|{longitude}".encode(),
+                    digest_size=16).hexdigest()
+                if st.session_state.get('_last_site_write') == write_key:
+                    st.info(f"ℹ️ {site_name} was just registered - skipping duplicate submit")
+                else:
+                    try:
+                        # Create default project if needed (resolved once per session)
+                        project_id = db.get_default_project_id()
                     
-                    # Create site with full context
-                    site = db.create_site_with_context(
-                        project_id=project_id,
-                        site_name=site_name,
-                        country=country,
-                        region=region,
-                        latitude=latitude,
-                        longitude=longitude,
-                        elevation=elevation,
-                        climate_zone=climate_zone,
-                        rainfall_regime=rainfall_regime,
-                        temperature_regime=temperature_regime,
-                        context_type=context_type,
-                        context_description=context_description,
-                        ph_condition=ph_condition,
-                        water_table=water_table,
-                        microbial_activity=microbial_activity,
-                        guano_presence=guano_presence,
-                        organic_preservation=organic_preservation,
-                        mineral_preservation=mineral_preservation,
-                        site_references=site_references,
-                        geoarch_studies=geoarch_studies,
-                        time_period=time_period,
-                        excavation_year=excavation_year,
-                        context_confidence=context_confidence,
-                        taphonomic_notes=taphonomic_notes
-                    )
-                    
-                    st.success(f"✅ Registered site: {site_name} with full context!")
-                    st.session_state.current_site_id = site['site_id']
+                        # Create site with full context
+                        site = db.create_site_with_context(
+                            project_id=project_id,
+                            site_name=site_name,
+                            country=country,
+                            region=region,
+                            latitude=latitude,
+                            longitude=longitude,
+                            elevation=elevation,
+                            climate_zone=climate_zone,
+                            rainfall_regime=rainfall_regime,
+                            temperature_regime=temperature_regime,
+                            context_type=context_type,
+                            context_description=context_description,
+                            ph_condition=ph_condition,
+                            water_table=water_table,
+                            microbial_activity=microbial_activity,
+                            guano_presence=guano_presence,
+                            organic_preservation=organic_preservation,
+                            mineral_preservation=mineral_preservation,
+                            site_references=site_references,
+                            geoarch_studies=geoarch_studies,
+                            time_period=time_period,
+                            excavation_year=excavation_year,
+                            context_confidence=context_confidence,
+                            taphonomic_notes=taphonomic_notes
+                        )
                     
-                    # Show context summary
-                    st.info(f"""
-                    **Context Summary:**
-                    - Type: {context_type}
-                    - Climate: {climate_zone}
-                    - Preservation: Organic={organic_preservation}, Mineral={mineral_preservation}
-                    - Authentication method will use context-specific criteria!
-                    """)
+                        st.session_state['_last_site_write'] = write_key
+                        st.success(f"✅ Registered site: {site_name} with full context!")
+                        st.session_state.current_site_id = site['site_id']
+
+                        # Show context summary
+                        st.info(f"""
+                        **Context Summary:**
+                        - Type: {context_type}
+                        - Climate: {climate_zone}
+                        - Preservation: Organic={organic_preservation}, Mineral={mineral_preservation}
+                        - Authentication method will use context-specific criteria!
+                        """)
                     
-                    st.rerun()
+                        st.rerun()
                     
-                except Exception as e:
-                    st.error(f"Error creating site: {str(e)}")
-                    st.exception(e)
+                    except Exception as e:
+                        st.error(f"Error creating site: {str(e)}")
+                        st.exception(e)
 
 def get_context_description(context_type):
     """Get brief description of expected signatures"""
-    descriptions = {
-        "cave_guano": "High P (3-20%), Mn indicator for bat guano",
-        "cave_carbonate": "High Ca, moderate P (0.5-3%)",
-        "open_air_sand": "Low P (<2%), Si contamination",
-        "peat_bog": "Very low P, excellent organic preservation"
-    }
-    return descriptions.get(context_type, "See literature for expected signatures")
-
-
-# ================================================
-# DATABASE FUNCTION TO ADD
-# ================================================
-
-def create_site_with_context(self, project_id, site_name, **context_params):
-    """
-    Create site with full taphonomic context
-    Add this to database.py TaphoSpecDB class
-    """
-    
-    data = {
-        "project_id": project_id,
-        "site_name": site_name,
-        "country": context_params.get('country'),
-        "region": context_params.get('region'),
-        "latitude": context_params.get('latitude'),
-        "longitude": context_params.get('longitude'),
-        "elevation": context_params.get('elevation'),
-        "climate_zone": context_params.get('climate_zone'),
-        "rainfall_regime": context_params.get('rainfall_regime'),
-        "temperature_regime": context_params.get('temperature_regime'),
-        "context_type": context_params.get('context_type'),
-        "context_type_detailed": context_params.get('context_description'),
-        "ph_condition": context_params.get('ph_condition'),
-        "water_table": context_params.get('water_table'),
-        "microbial_activity": context_params.get('microbial_activity'),
-        "guano_presence": context_params.get('guano_presence', False),
-        "organic_preservation": context_params.get('organic_preservation'),
-        "mineral_preservation": context_params.get('mineral_preservation'),
-        "site_references": context_params.get('site_references'),
-        "geoarch_studies": context_params.get('geoarch_studies'),
-        "time_period": context_params.get('time_period'),
-        "excavation_year": context_params.get('excavation_year'),
-        "context_confidence": context_params.get('context_confidence'),
-        "taphonomic_notes": context_params.get('taphonomic_notes')
-    }
-    
-    # Remove None values
-    data = {k: v for k, v in data.items() if v is not None}
-    
-    result = self.client.table("sites").insert(data).execute()
-    return result.data[0] if result.data else None
+    return _CONTEXT_DESCRIPTIONS.get(context_type, _DEFAULT_CONTEXT_DESCRIPTION)
@@ -4,9 +4,30 @@ Add, edit, and verify reference spectra in the library
 """
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import date
 
+# Rows rendered per page in the view tab; the same value is pushed to
+# the DB as LIMIT/OFFSET so rows outside the window never cross the wire
+_VIEW_PAGE_ROWS = 500
+
+# (display label, library column) pairs for the EDS preview, built once
+# instead of f-string key construction per element per render
+_EDS_KEYS = [(elem, f'eds_{elem.lower()}')
+             for elem in ('C', 'N', 'P', 'Ca', 'K', 'Al', 'Mn', 'Fe', 'Si', 'Mg')]
+
+def _parse_keywords(s):
+    """Split comma-separated keywords, dropping empties from stray commas"""
+    return [k for k in (p.strip() for p in s.split(',')) if k] if s else []
+
+
+# Option orders plus O(1) value->index maps for the edit-form selectboxes
+_SPECTRUM_IDX = {'archaeological': 0, 'experimental': 1}
+_SPECTRUM_OPTS = tuple(_SPECTRUM_IDX)
+_CONTAM_IDX = {'none': 0, 'low': 1, 'medium': 2, 'high': 3}
+_CONTAM_OPTS = tuple(_CONTAM_IDX)
+
 def render_library_management_page(db):
     """Main library management page"""
     
@@ -34,6 +55,7 @@ def render_library_management_page(db):
         library_statistics_tab(db)
 
 
+@st.fragment
 def view_library_tab(db):
     """View all library entries"""
     
@@ -59,33 +81,50 @@ def view_library_tab(db):
     
     with col4:
         filter_multimodal = st.checkbox("Multi-modal only")
-    
-    # Get entries
+
+    page = st.number_input("Page", min_value=1, value=1, step=1,
+                           help=f"{_VIEW_PAGE_ROWS} entries per page")
+
+    # Get one page of entries (LIMIT/OFFSET applied in the DB)
     entries = db.get_library_entries(
         spectrum_type=None if filter_type == 'All' else filter_type,
         material_type=None if filter_material == 'All' else filter_material,
         verified_only=filter_verified,
-        multimodal_only=filter_multimodal
+        multimodal_only=filter_multimodal,
+        limit=_VIEW_PAGE_ROWS,
+        offset=(page - 1) * _VIEW_PAGE_ROWS
     )
-    
+
     if not entries:
-        st.info("No entries match the current filters.")
+        st.info("No entries match the current filters." if page == 1
+                else "No more entries - go back a page.")
         return
-    
-    st.write(f"**Found {len(entries)} entries**")
-    
-    # Display as dataframe
-    display_df = pd.DataFrame([{
-        'Name': e.get('spectrum_name'),
-        'Code': e.get('spectrum_code', 'N/A'),
-        'Type': e.get('spectrum_type'),
-        'Material': e.get('material_type'),
-        'Source': e.get('source_type', 'N/A'),
-        'EDS': '✓' if e.get('has_eds') else '✗',
-        'FTIR': '✓' if e.get('has_ftir') else '✗',
-        'Verified': '✓' if e.get('verified') else '✗',
-        'Keywords': ', '.join(e.get('keywords', [])) if e.get('keywords') else 'None'
-    } for e in entries])
+
+    if len(entries) == _VIEW_PAGE_ROWS:
+        st.write(f"**Showing entries {(page - 1) * _VIEW_PAGE_ROWS + 1}-"
+                 f"{page * _VIEW_PAGE_ROWS}** (more on the next page)")
+    else:
+        st.write(f"**Found {len(entries)} entries**")
+    
+    # Display as dataframe - pandas ingests the records columnar in one
+    # shot, then the formatting runs as vectorized column ops instead of
+    # a 9-key dict allocation per row
+    display_df = pd.DataFrame.from_records(
+        entries,
+        columns=['spectrum_name', 'spectrum_code', 'spectrum_type',
+                 'material_type', 'source_type', 'has_eds', 'has_ftir',
+                 'verified', 'keywords']
+    ).rename(columns={
+        'spectrum_name': 'Name', 'spectrum_code': 'Code',
+        'spectrum_type': 'Type', 'material_type': 'Material',
+        'source_type': 'Source', 'has_eds': 'EDS', 'has_ftir': 'FTIR',
+        'verified': 'Verified', 'keywords': 'Keywords'
+    })
+    for col in ('EDS', 'FTIR', 'Verified'):
+        display_df[col] = np.where(display_df[col].fillna(False).astype(bool), '✓', '✗')
+    display_df['Keywords'] = [', '.join(kw) if isinstance(kw, list) and kw else 'None'
+                              for kw in display_df['Keywords']]
+    display_df[['Code', 'Source']] = display_df[['Code', 'Source']].fillna('N/A')
     
     st.dataframe(display_df, use_container_width=True, hide_index=True)
     
@@ -93,48 +132,63 @@ def view_library_tab(db):
     st.markdown("---")
     st.subheader("🔍 Detailed View")
     
-    entry_names = {e.get('spectrum_name'): e for e in entries}
-    selected_name = st.selectbox("Select entry to view", options=list(entry_names.keys()))
-    
+    # Offer the names only; materialize the chosen entry lazily instead
+    # of building a name->entry dict on every rerun
+    selected_name = st.selectbox("Select entry to view",
+                                 options=[e.get('spectrum_name') for e in entries])
+
     if selected_name:
-        entry = entry_names[selected_name]
+        entry = next(e for e in entries if e.get('spectrum_name') == selected_name)
         display_library_entry_details(entry)
 
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _build_analysis_options(analysis_ids, _analyses):
+    """Selectbox labels for candidate analyses, keyed by the id tuple
+
+    The f-string per analysis runs once per distinct candidate set
+    instead of on every rerun (_analyses is excluded from the cache key).
+    """
+    labels = [
+        f"{a.get('sample_id', 'Unknown')[:8]} - Point {a.get('analysis_point_number', 'N/A')} - {a.get('classification', 'Unclassified')}"
+        for a in _analyses
+    ]
+    return labels, dict(zip(labels, _analyses))
+
+
+@st.fragment
 def add_library_entry_tab(db):
     """Add new library entry"""
     
     st.subheader("➕ Add New Library Entry")
     
     st.info("💡 Link an existing EDS analysis to the library as a reference spectrum")
-    
-    # Get available EDS analyses
-    all_analyses = db.get_eds_analyses()
-    
-    if not all_analyses:
-        st.warning("No EDS analyses available. Import data first.")
-        return
-    
-    # Filter out analyses already in library
-    library_entries = db.get_library_entries()
-    library_analysis_ids = {e.get('eds_spectrum_id') for e in library_entries if e.get('eds_spectrum_id')}
-    
-    available_analyses = [a for a in all_analyses if a.get('analysis_id') not in library_analysis_ids]
-    
+
+    # Streamlit renders every tab body on page load, so gate the
+    # candidate-analyses query behind an explicit open; the fragment
+    # rerun on click stays scoped to this tab
+    if not st.session_state.get('add_entry_form_open'):
+        if st.button("📂 Load add-entry form"):
+            st.session_state.add_entry_form_open = True
+        else:
+            return
+
+    # Analyses not yet linked to the library (anti-join done server-side)
+    available_analyses = db.get_unlinked_eds_analyses()
+
     if not available_analyses:
-        st.warning("All EDS analyses are already in the library.")
+        st.warning("No unlinked EDS analyses available. Import data first.")
         return
     
     with st.form("add_library_entry"):
         st.markdown("**Step 1: Select EDS Spectrum**")
         
-        analysis_options = {
-            f"{a.get('sample_id', 'Unknown')[:8]} - Point {a.get('analysis_point_number', 'N/A')} - {a.get('classification', 'Unclassified')}": a
-            for a in available_analyses
-        }
-        
-        selected_option = st.selectbox("Select EDS analysis", options=list(analysis_options.keys()))
-        selected_analysis = analysis_options[selected_option]
+        labels, analysis_by_label = _build_analysis_options(
+            tuple(a.get('analysis_id') for a in available_analyses),
+            available_analyses)
+
+        selected_option = st.selectbox("Select EDS analysis", options=labels)
+        selected_analysis = analysis_by_label[selected_option]
         
         # Show preview
         col1, col2, col3 = st.columns(3)
@@ -232,7 +286,7 @@ def add_library_entry_tab(db):
                 st.error("Please fill in all required fields (*)")
             else:
                 # Parse keywords
-                keywords = [kw.strip() for kw in keywords_input.split(',')] if keywords_input else []
+                keywords = _parse_keywords(keywords_input)
                 
                 # Create library entry
                 try:
@@ -256,13 +310,13 @@ def add_library_entry_tab(db):
                     )
                     
                     st.success(f"✓ Added to library: {spectrum_name}")
-                    st.balloons()
                     st.rerun()
                     
                 except Exception as e:
                     st.error(f"Error adding to library: {str(e)}")
 
 
+@st.fragment
 def edit_library_entry_tab(db):
     """Edit existing library entry"""
     
@@ -275,11 +329,11 @@ def edit_library_entry_tab(db):
         st.info("Library is empty. Add entries first.")
         return
     
-    # Select entry to edit
-    entry_options = {e.get('spectrum_name'): e for e in entries}
-    selected_name = st.selectbox("Select entry to edit", options=list(entry_options.keys()))
-    
-    entry = entry_options[selected_name]
+    # Select entry to edit (chosen entry materialized lazily, as above)
+    selected_name = st.selectbox("Select entry to edit",
+                                 options=[e.get('spectrum_name') for e in entries])
+
+    entry = next(e for e in entries if e.get('spectrum_name') == selected_name)
     
     # Edit form
     with st.form("edit_library_entry"):
@@ -289,8 +343,8 @@ def edit_library_entry_tab(db):
             spectrum_name = st.text_input("Spectrum Name", value=entry.get('spectrum_name', ''))
             spectrum_type = st.selectbox(
                 "Spectrum Type",
-                options=['archaeological', 'experimental'],
-                index=0 if entry.get('spectrum_type') == 'archaeological' else 1
+                options=_SPECTRUM_OPTS,
+                index=_SPECTRUM_IDX.get(entry.get('spectrum_type'), 0)
             )
             material_type = st.text_input("Material Type", value=entry.get('material_type', ''))
             source_reference = st.text_input("Source Reference", value=entry.get('source_reference', ''))
@@ -305,15 +359,16 @@ def edit_library_entry_tab(db):
             
             contamination_level = st.selectbox(
                 "Contamination Level",
-                options=['none', 'low', 'medium', 'high'],
-                index=['none', 'low', 'medium', 'high'].index(entry.get('contamination_level', 'none'))
+                options=_CONTAM_OPTS,
+                index=_CONTAM_IDX.get(entry.get('contamination_level'), 0)
             )
             
             verified = st.checkbox("Verified", value=entry.get('verified', False))
         
+        entry_keywords = entry.get('keywords')
         keywords_input = st.text_input(
             "Keywords (comma-separated)",
-            value=', '.join(entry.get('keywords', [])) if entry.get('keywords') else ''
+            value=', '.join(entry_keywords) if entry_keywords else ''
         )
         
         description = st.text_area(
@@ -331,7 +386,7 @@ def edit_library_entry_tab(db):
             delete_submitted = st.form_submit_button("🗑️ Delete Entry", use_container_width=True)
         
         if update_submitted:
-            keywords = [kw.strip() for kw in keywords_input.split(',')] if keywords_input else []
+            keywords = _parse_keywords(keywords_input)
             
             updates = {
                 'spectrum_name': spectrum_name,
@@ -365,6 +420,7 @@ def edit_library_entry_tab(db):
                 st.error(f"Error deleting entry: {str(e)}")
 
 
+@st.fragment
 def library_statistics_tab(db):
     """Show library statistics"""
     
@@ -386,38 +442,31 @@ def library_statistics_tab(db):
     
     st.markdown("---")
     
-    # Type breakdown
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("**Spectrum Types:**")
-        st.metric("🏛️ Archaeological", stats.get('archaeological_count', 0))
-        st.metric("🧪 Experimental", stats.get('experimental_count', 0))
-    
-    with col2:
-        st.markdown("**Analysis Types:**")
-        st.metric("⚛️ EDS", stats.get('eds_count', 0))
-        st.metric("📈 FTIR", stats.get('ftir_count', 0))
-        st.metric("🔗 Both (Multi-modal)", stats.get('multimodal_count', 0))
+    # Type breakdown - one table instead of five st.metric widgets, so
+    # the frontend gets a single element to render
+    st.markdown("**Spectrum & Analysis Types:**")
+    breakdown_df = pd.DataFrame({
+        'Category': ['🏛️ Archaeological', '🧪 Experimental', '⚛️ EDS',
+                     '📈 FTIR', '🔗 Both (Multi-modal)'],
+        'Count': [stats.get('archaeological_count', 0),
+                  stats.get('experimental_count', 0),
+                  stats.get('eds_count', 0),
+                  stats.get('ftir_count', 0),
+                  stats.get('multimodal_count', 0)]
+    })
+    st.dataframe(breakdown_df, use_container_width=True, hide_index=True)
     
     # Detailed breakdown
     st.markdown("---")
     st.markdown("**Library Contents by Category:**")
     
-    entries = db.get_library_entries()
-    
-    if entries:
-        # By material type
-        material_counts = {}
-        for e in entries:
-            mat = e.get('material_type', 'unknown')
-            material_counts[mat] = material_counts.get(mat, 0) + 1
-        
-        mat_df = pd.DataFrame([
-            {'Material Type': k, 'Count': v}
-            for k, v in sorted(material_counts.items(), key=lambda x: x[1], reverse=True)
-        ])
-        
+    # Counted and sorted by the DB (GROUP BY in the material_type_counts RPC)
+    material_counts = db.get_material_type_counts()
+
+    if material_counts:
+        mat_df = pd.DataFrame(material_counts).rename(
+            columns={'material_type': 'Material Type', 'count': 'Count'})
+
         st.dataframe(mat_df, use_container_width=True, hide_index=True)
 
 
@@ -452,9 +501,10 @@ def display_library_entry_details(entry):
         st.write(f"**EDS:** {'✓ Yes' if entry.get('has_eds') else '✗ No'}")
         st.write(f"**FTIR:** {'✓ Yes' if entry.get('has_ftir') else '✗ No'}")
     
-    if entry.get('keywords'):
+    keywords = entry.get('keywords')
+    if keywords:
         st.markdown("**Keywords:**")
-        st.write(', '.join(entry.get('keywords')))
+        st.write(', '.join(keywords))
     
     if entry.get('description'):
         st.markdown("**Description:**")
@@ -464,13 +514,9 @@ def display_library_entry_details(entry):
     if entry.get('has_eds'):
         st.markdown("**EDS Elemental Composition:**")
         
-        elements = ['C', 'N', 'P', 'Ca', 'K', 'Al', 'Mn', 'Fe', 'Si', 'Mg']
-        eds_data = []
-        
-        for elem in elements:
-            val = entry.get(f'eds_{elem.lower()}', 0)
-            if val and val > 0:
-                eds_data.append({'Element': elem, 'Weight %': f'{val:.2f}'})
+        eds_data = [{'Element': elem, 'Weight %': f'{val:.2f}'}
+                    for elem, key in _EDS_KEYS
+                    if (val := entry.get(key, 0)) and val > 0]
         
         if eds_data:
             eds_df = pd.DataFrame(eds_data)
@@ -8,7 +8,27 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from database import calculate_distance
+from database import build_library_matrix, build_query_vector, calculate_distances_matrix
+
+# (lowercase analysis key, library eds_ column) per element, built once
+# instead of .lower()/f-string work per element per rendered match
+_ALL_ELEMENTS = ('C', 'N', 'P', 'Ca', 'K', 'Al', 'Mn', 'Fe', 'Si', 'Mg',
+                 'Na', 'S', 'Cl', 'Ti', 'Zn')
+_ELEM_KEYS = {e: (e.lower(), f'eds_{e.lower()}') for e in _ALL_ELEMENTS}
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _build_analysis_options(analysis_ids, _analyses):
+    """Selectbox labels for the candidate analyses, keyed by the id tuple
+
+    Reruns reuse the formatted labels while the candidate set is
+    unchanged (_analyses is excluded from the cache key).
+    """
+    labels = [
+        f"{a.get('sample_id', 'Unknown')[:8]} - Point {a.get('analysis_point_number', 'N/A')} - {a.get('classification', 'Unclassified')}"
+        for a in _analyses
+    ]
+    return labels, dict(zip(labels, _analyses))
 
 def render_library_search_page(db):
     """Main library search page"""
@@ -61,35 +81,25 @@ def render_library_search_page(db):
     with col1:
         st.markdown("**Step 1: Select Unknown Spectrum**")
         
-        # Get available EDS analyses
-        all_analyses = db.get_eds_analyses()
-        
-        if not all_analyses:
-            st.warning("No EDS analyses available. Import data first.")
-            return
-        
-        # Filter out analyses already in library
-        library_entries = db.get_library_entries()
-        library_analysis_ids = {e.get('eds_spectrum_id') for e in library_entries if e.get('eds_spectrum_id')}
-        
-        available_analyses = [a for a in all_analyses if a.get('analysis_id') not in library_analysis_ids]
-        
+        # One anti-join RPC instead of fetching all analyses plus all
+        # library entries and diffing them in Python per rerun
+        available_analyses = db.get_unlinked_eds_analyses()
+
         if not available_analyses:
-            st.warning("All EDS analyses are already in the library.")
+            st.warning("No unlinked EDS analyses available. Import data first, or add more analyses — all existing ones are already in the library.")
             return
         
         # Create selection options
-        analysis_options = {
-            f"{a.get('sample_id', 'Unknown')[:8]} - Point {a.get('analysis_point_number', 'N/A')} - {a.get('classification', 'Unclassified')}": a
-            for a in available_analyses
-        }
-        
+        labels, analysis_by_label = _build_analysis_options(
+            tuple(a.get('analysis_id') for a in available_analyses),
+            available_analyses)
+
         selected_option = st.selectbox(
             "Select spectrum to search",
-            options=list(analysis_options.keys())
+            options=labels
         )
-        
-        query_spectrum = analysis_options[selected_option]
+
+        query_spectrum = analysis_by_label[selected_option]
     
     with col2:
         st.markdown("**Query Spectrum Info:**")
@@ -125,12 +135,11 @@ def render_library_search_page(db):
     
     with col2:
         # Elements to include
-        all_elements = ['C', 'N', 'P', 'Ca', 'K', 'Al', 'Mn', 'Fe', 'Si', 'Mg', 'Na', 'S', 'Cl', 'Ti', 'Zn']
         default_elements = ['C', 'P', 'Ca', 'Mn', 'K', 'Al', 'Fe', 'Si']
-        
+
         selected_elements = st.multiselect(
             "Elements to Compare",
-            options=all_elements,
+            options=list(_ALL_ELEMENTS),
             default=default_elements,
             help="Select which elements to include in distance calculation"
         )
@@ -211,46 +220,78 @@ def render_library_search_page(db):
         )
 
 
-def perform_library_search(db, query_spectrum, elements, metric, top_n, 
+@st.cache_data(ttl=15, show_spinner=False)
+def _library_signature(_db, version):
+    """Throttled library write signature
+
+    The durable signature costs one round-trip, so it is probed at most
+    every 15s; the in-process version key still forces an immediate
+    re-probe after writes from this worker.
+    """
+    return _db.library_signature()
+
+
+@st.cache_data(persist="disk", max_entries=32, show_spinner=False)
+def _load_library_matrix(_db, elements, verified_only, multimodal_only,
+                         filter_types, filter_materials, signature):
+    """Filtered library entries plus their prebuilt search matrix
+
+    Cached per filter signature so repeated searches reuse the float32
+    matrix instead of re-fetching and rebuilding it per click.
+    persist="disk" survives worker restarts, so a fresh process serves
+    its first search from the on-disk matrix instead of refetching the
+    whole library. The key includes the durable library signature
+    (count + max updated_at), not the in-process write counter - the
+    counter resets on restart, which would pin a stale disk entry.
+    """
+    # Filters run as indexed WHERE clauses server-side, so only rows
+    # the search can actually use cross the wire; the paging getter
+    # keeps the matrix complete past the per-request row cap
+    entries = _db.get_all_library_entries(
+        verified_only=verified_only,
+        multimodal_only=multimodal_only,
+        spectrum_types=filter_types or None,
+        material_types=filter_materials or None,
+        require_eds=True
+    )
+
+    M = build_library_matrix(entries, list(elements))
+    # Row norms cached alongside the matrix: euclidean and cosine then
+    # need only one matvec per search
+    norms_sq = np.einsum('ij,ij->i', M, M) if len(entries) else None
+    return entries, M, norms_sq
+
+
+def perform_library_search(db, query_spectrum, elements, metric, top_n,
                           filter_types, filter_materials, verified_only, multimodal_only):
     """
     Perform library search with filters
     """
-    # Get library entries with filters
-    library_entries = db.get_library_entries(
-        verified_only=verified_only,
-        multimodal_only=multimodal_only
+    # Entries, matrix and row norms come prebuilt from the per-filter cache
+    library_entries, M, norms_sq = _load_library_matrix(
+        db, tuple(elements), verified_only, multimodal_only,
+        tuple(filter_types or ()), tuple(filter_materials or ()),
+        _library_signature(db, db.library_version)
     )
-    
-    # Apply type filter
-    if filter_types:
-        library_entries = [e for e in library_entries if e.get('spectrum_type') in filter_types]
-    
-    # Apply material filter
-    if filter_materials:
-        library_entries = [e for e in library_entries if e.get('material_type') in filter_materials]
-    
-    # Only entries with EDS data
-    library_entries = [e for e in library_entries if e.get('has_eds')]
-    
+
     if not library_entries:
         return []
-    
-    # Calculate distances
+
+    # Calculate all distances in one vectorized pass over the library matrix
+    q = build_query_vector(query_spectrum, elements)
+    distances = calculate_distances_matrix(M, q, metric, row_norms_sq=norms_sq)
+
+    # Top-k on raw distances: argpartition selects in O(N), then only
+    # the k survivors are sorted. 1/(1+d) is monotonic in d, so ranking
+    # by distance gives the same order as ranking by similarity.
+    k = min(top_n, len(distances))
+    idx = np.argpartition(distances, k - 1)[:k]
+    idx = idx[np.argsort(distances[idx])]
+
     matches = []
-    
-    for lib_entry in library_entries:
-        # Get elemental data (already in library_complete view)
-        distance = calculate_distance(
-            query_spectrum,
-            lib_entry,
-            elements,
-            metric
-        )
-        
-        # Convert distance to similarity score (0-1, higher is better)
-        similarity_score = 1 / (1 + distance)
-        
+    for i in idx:
+        lib_entry = library_entries[i]
+        distance = float(distances[i])
         matches.append({
             'library_id': lib_entry.get('library_id'),
             'spectrum_name': lib_entry.get('spectrum_name'),
@@ -260,14 +301,11 @@ def perform_library_search(db, query_spectrum, elements, metric, top_n,
             'verified': lib_entry.get('verified', False),
             'has_ftir': lib_entry.get('has_ftir', False),
             'distance': distance,
-            'similarity_score': similarity_score,
+            'similarity_score': 1.0 / (1.0 + distance),
             'elemental_data': lib_entry
         })
-    
-    # Sort by similarity (highest first)
-    matches.sort(key=lambda x: x['similarity_score'], reverse=True)
-    
-    return matches[:top_n]
+
+    return matches
 
 
 def display_search_results(db, matches, query_spectrum, search_params):
@@ -295,9 +333,15 @@ def display_search_results(db, matches, query_spectrum, search_params):
     st.markdown("---")
     st.subheader("📊 Detailed Match Comparison")
     
-    for i, match in enumerate(matches):
-        with st.expander(f"#{i+1}: {match['spectrum_name']} - Similarity: {match['similarity_score']:.3f}", expanded=(i==0)):
-            display_match_details(db, match, query_spectrum, search_params['elements'])
+    # Only the selected match is rendered: tabs and collapsed expanders
+    # still execute every body per rerun, so this is the one way to skip
+    # building the comparison table and figure for the other matches
+    detail_idx = st.selectbox(
+        "Match to inspect",
+        options=range(len(matches)),
+        format_func=lambda i: f"#{i+1}: {matches[i]['spectrum_name']} ({matches[i]['similarity_score']:.3f})"
+    )
+    display_match_details(db, matches[detail_idx], query_spectrum, search_params['elements'])
     
     # Accept/Reject section
     st.markdown("---")
@@ -316,21 +360,15 @@ def display_search_results(db, matches, query_spectrum, search_params):
         feedback = st.text_area("Feedback (optional)", placeholder="Notes about this match...")
     
     if st.button("✓ Accept This Match", type="primary"):
-        # Log search with user feedback
-        search_id = db.log_library_search(
+        # Log search and acceptance in one write
+        db.log_and_accept_library_search(
             query_spectrum_id=query_spectrum['analysis_id'],
             query_type='eds',
             search_params=search_params,
             results=[{k: v for k, v in m.items() if k != 'elemental_data'} for m in matches],
-            user_id=st.session_state.get('user_id')
-        )
-        
-        # Update with acceptance
-        db.update_search_feedback(
-            search_id=search_id['search_id'],
-            accepted=True,
             selected_id=matches[selected_match_idx]['library_id'],
-            feedback=feedback if feedback else None
+            feedback=feedback if feedback else None,
+            user_id=st.session_state.get('user_id')
         )
         
         st.success(f"✓ Match accepted: {matches[selected_match_idx]['spectrum_name']}")
@@ -363,21 +401,23 @@ def display_match_details(db, match, query_spectrum, elements):
     # Elemental comparison table
     st.markdown("**Elemental Composition Comparison:**")
     
-    comparison_data = []
-    for element in elements:
-        query_val = query_spectrum.get(element.lower(), 0)
-        match_val = match['elemental_data'].get(f'eds_{element.lower()}', 0) or 0
-        diff = abs(query_val - match_val)
-        
-        comparison_data.append({
-            'Element': element,
-            'Query (%)': f"{query_val:.2f}",
-            'Match (%)': f"{match_val:.2f}",
-            'Difference': f"{diff:.2f}",
-            'Rel. Diff (%)': f"{(diff/max(query_val, 0.01)*100):.1f}"
-        })
-    
-    comp_df = pd.DataFrame(comparison_data)
+    n = len(elements)
+    query_arr = np.fromiter(
+        (query_spectrum.get(_ELEM_KEYS[e][0], 0) or 0 for e in elements),
+        dtype=np.float32, count=n)
+    match_arr = np.fromiter(
+        (match['elemental_data'].get(_ELEM_KEYS[e][1], 0) or 0 for e in elements),
+        dtype=np.float32, count=n)
+    diff = np.abs(query_arr - match_arr)
+    rel = diff / np.maximum(query_arr, 0.01) * 100
+
+    comp_df = pd.DataFrame({
+        'Element': elements,
+        'Query (%)': query_arr.round(2),
+        'Match (%)': match_arr.round(2),
+        'Difference': diff.round(2),
+        'Rel. Diff (%)': rel.round(1),
+    })
     st.dataframe(comp_df, use_container_width=True, hide_index=True)
     
     # Visualization
@@ -387,34 +427,45 @@ def display_match_details(db, match, query_spectrum, elements):
 
 def plot_spectrum_comparison(query, match, elements):
     """Create comparison bar chart"""
-    
-    query_values = [query.get(e.lower(), 0) for e in elements]
-    match_values = [match['elemental_data'].get(f'eds_{e.lower()}', 0) or 0 for e in elements]
-    
+
+    query_values = tuple(query.get(_ELEM_KEYS[e][0], 0) for e in elements)
+    match_values = tuple(match['elemental_data'].get(_ELEM_KEYS[e][1], 0) or 0 for e in elements)
+
+    return _build_comparison_fig(query_values, match_values, tuple(elements),
+                                 match['spectrum_name'], match['similarity_score'])
+
+
+@st.cache_data(max_entries=200, show_spinner=False)
+def _build_comparison_fig(query_values, match_values, elements, match_name, similarity):
+    """Comparison figure, memoized so reruns skip Plotly rebuild + serialize
+
+    Every rerun re-enters the match expanders; with the value tuples as
+    the cache key, an unchanged match reuses its serialized figure.
+    """
     fig = go.Figure()
-    
+
     # Query spectrum
     fig.add_trace(go.Bar(
         name='Query (Unknown)',
-        x=elements,
-        y=query_values,
+        x=list(elements),
+        y=list(query_values),
         marker_color='lightblue',
         text=[f'{v:.1f}%' for v in query_values],
         textposition='outside'
     ))
-    
+
     # Match spectrum
     fig.add_trace(go.Bar(
-        name=f"Match: {match['spectrum_name']}",
-        x=elements,
-        y=match_values,
+        name=f"Match: {match_name}",
+        x=list(elements),
+        y=list(match_values),
         marker_color='coral',
         text=[f'{v:.1f}%' for v in match_values],
         textposition='outside'
     ))
-    
+
     fig.update_layout(
-        title=f"Spectrum Comparison - Similarity: {match['similarity_score']:.3f}",
+        title=f"Spectrum Comparison - Similarity: {similarity:.3f}",
         xaxis_title='Element',
         yaxis_title='Weight %',
         barmode='group',
@@ -422,5 +473,5 @@ def plot_spectrum_comparison(query, match, elements):
         showlegend=True,
         hovermode='x unified'
     )
-    
+
     return fig
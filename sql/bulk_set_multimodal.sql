@@ -0,0 +1,19 @@
+-- ================================================
+-- Bulk multimodal classification updates
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Review workflows classify many links at once; one UPDATE ... FROM
+-- over the payload array replaces an UPDATE round-trip per link.
+
+CREATE OR REPLACE FUNCTION bulk_set_multimodal(payloads jsonb)
+RETURNS void AS $$
+    UPDATE multimodal_analyses m
+    SET combined_classification = p->>'classification',
+        confidence_score = (p->>'confidence_score')::float,
+        agreement_level = p->>'agreement_level',
+        all_techniques_agree = (p->>'agreement_level' = 'full'),
+        requires_review = (p->>'agreement_level' = 'conflict'),
+        reasoning = p->>'reasoning'
+    FROM jsonb_array_elements(payloads) p
+    WHERE m.link_id = (p->>'link_id')::uuid;
+$$ LANGUAGE sql;
@@ -0,0 +1,25 @@
+-- ================================================
+-- Atomic sequential-experiment creation
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Reads the parent experiment and inserts the child in one statement,
+-- replacing a fetch-parent + insert-child round-trip pair and the race
+-- on concurrent treatment_sequence increments.
+
+CREATE OR REPLACE FUNCTION create_sequential_experiment(
+    p_parent uuid, p_treatment text, p_desc text DEFAULT NULL)
+RETURNS experimental_samples AS $$
+    INSERT INTO experimental_samples (
+        experiment_name, parent_experiment_id, treatment_sequence,
+        researcher, base_material, preparation_protocol,
+        degradation_type, treatment_description, cumulative_treatments)
+    SELECT experiment_name || ' + ' || p_treatment,
+           p_parent,
+           coalesce(treatment_sequence, 0) + 1,
+           researcher, base_material, preparation_protocol,
+           p_treatment, p_desc,
+           coalesce(cumulative_treatments, '{}') || p_treatment
+    FROM experimental_samples
+    WHERE experiment_id = p_parent
+    RETURNING *;
+$$ LANGUAGE sql;
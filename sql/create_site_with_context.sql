@@ -0,0 +1,35 @@
+-- ================================================
+-- Atomic site creation with taphonomic context
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Takes the whole context payload as one jsonb argument, so the client
+-- sends a single RPC call and NULL handling happens here instead of
+-- per-column stripping in Python. Columns absent from the payload fall
+-- back to their defaults.
+
+CREATE OR REPLACE FUNCTION create_site_with_context(p jsonb)
+RETURNS sites AS $$
+DECLARE
+    src sites := jsonb_populate_record(NULL::sites, p);
+    created sites;
+BEGIN
+    INSERT INTO sites (
+        project_id, site_name, country, region, latitude, longitude,
+        elevation, climate_zone, rainfall_regime, temperature_regime,
+        context_type, context_type_detailed, ph_condition, water_table,
+        microbial_activity, guano_presence, organic_preservation,
+        mineral_preservation, site_references, geoarch_studies,
+        time_period, excavation_year, context_confidence, taphonomic_notes)
+    VALUES (
+        src.project_id, src.site_name, src.country, src.region, src.latitude,
+        src.longitude, src.elevation, src.climate_zone, src.rainfall_regime,
+        src.temperature_regime, src.context_type, src.context_type_detailed,
+        src.ph_condition, src.water_table, src.microbial_activity,
+        coalesce(src.guano_presence, false), src.organic_preservation,
+        src.mineral_preservation, src.site_references, src.geoarch_studies,
+        src.time_period, src.excavation_year, src.context_confidence,
+        src.taphonomic_notes)
+    RETURNING * INTO created;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
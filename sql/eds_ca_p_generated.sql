@@ -0,0 +1,11 @@
+-- ================================================
+-- Server-side Ca/P ratio for eds_analyses
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Postgres computes the ratio on insert/update, so the Python client
+-- no longer calculates (or ships) it per row.
+
+ALTER TABLE eds_analyses DROP COLUMN IF EXISTS ca_p_ratio;
+ALTER TABLE eds_analyses
+    ADD COLUMN ca_p_ratio numeric
+    GENERATED ALWAYS AS (ca / NULLIF(p, 0)) STORED;
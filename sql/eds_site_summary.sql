@@ -0,0 +1,32 @@
+-- ================================================
+-- Server-side EDS aggregates for site dashboards
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Site dashboards mostly need counts and element means, not raw rows.
+-- Aggregating in one pass here instead of shipping every analysis to
+-- Python cuts wire bytes by roughly two orders of magnitude.
+
+CREATE OR REPLACE FUNCTION eds_site_summary(p_site_id uuid)
+RETURNS TABLE (
+    residue_count  bigint,
+    analysis_count bigint,
+    mean_ca        numeric,
+    mean_p         numeric,
+    mean_ca_p      numeric,
+    mean_si        numeric,
+    mean_fe        numeric,
+    mean_mn        numeric
+) AS $$
+    SELECT count(DISTINCT r.residue_id),
+           count(e.analysis_id),
+           avg(e.ca),
+           avg(e.p),
+           avg(e.ca / NULLIF(e.p, 0)),
+           avg(e.si),
+           avg(e.fe),
+           avg(e.mn)
+    FROM samples s
+    JOIN residues r ON r.sample_id = s.sample_id
+    JOIN eds_analyses e ON e.residue_id = r.residue_id
+    WHERE s.site_id = p_site_id;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,21 @@
+-- ================================================
+-- Recursive lineage walk for experimental degradation series
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Walks parent_experiment_id from a root experiment server-side, so the
+-- client receives only the lineage instead of scanning the whole table.
+
+CREATE INDEX IF NOT EXISTS experimental_samples_parent_idx
+    ON experimental_samples (parent_experiment_id);
+
+CREATE OR REPLACE FUNCTION get_degradation_series(root uuid)
+RETURNS SETOF experimental_samples AS $$
+    WITH RECURSIVE series AS (
+        SELECT * FROM experimental_samples
+        WHERE experiment_id = root
+        UNION ALL
+        SELECT e.* FROM experimental_samples e
+        JOIN series s ON e.parent_experiment_id = s.experiment_id
+    )
+    SELECT * FROM series ORDER BY treatment_sequence;
+$$ LANGUAGE sql STABLE;
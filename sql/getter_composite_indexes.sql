@@ -0,0 +1,16 @@
+-- ================================================
+-- Composite indexes for hot filter+order getters
+-- Run in the Supabase SQL editor
+-- ================================================
+-- get_residues(sample_id=...) filters on sample_id and orders by
+-- residue_number; get_eds_by_residue filters on residue_id and orders
+-- by analysis_point_number. Composite indexes serve both the filter
+-- and the ordering from one index scan, with no sort node.
+-- (eds_analyses (created_at DESC) for the default-order path already
+-- exists in list_pagination_indexes.sql.)
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS residues_sample_num_idx
+    ON residues (sample_id, residue_number);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS eds_residue_point_idx
+    ON eds_analyses (residue_id, analysis_point_number);
@@ -0,0 +1,55 @@
+-- ================================================
+-- Materialized views for read-heavy library aggregations
+-- Run in the Supabase SQL editor
+-- ================================================
+-- library_complete joins spectral_library with its EDS/FTIR data and
+-- library_statistics aggregates counts; both are recomputed on every
+-- read. Materializing them replaces the repeated JOIN/aggregate with an
+-- indexed scan, refreshed out-of-band after writes.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS library_complete_mv AS
+    SELECT * FROM library_complete;
+
+CREATE UNIQUE INDEX IF NOT EXISTS library_complete_mv_id
+    ON library_complete_mv (library_id);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS library_statistics_mv AS
+    SELECT * FROM library_statistics;
+
+-- Writes enqueue a refresh request instead of refreshing inline
+CREATE TABLE IF NOT EXISTS mv_refresh_queue (
+    queued_at timestamptz DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION enqueue_mv_refresh()
+RETURNS trigger AS $$
+BEGIN
+    INSERT INTO mv_refresh_queue DEFAULT VALUES;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_library_mv_refresh ON spectral_library;
+CREATE TRIGGER trg_library_mv_refresh
+    AFTER INSERT OR UPDATE OR DELETE ON spectral_library
+    FOR EACH STATEMENT EXECUTE FUNCTION enqueue_mv_refresh();
+
+DROP TRIGGER IF EXISTS trg_eds_mv_refresh ON eds_analyses;
+CREATE TRIGGER trg_eds_mv_refresh
+    AFTER INSERT OR UPDATE OR DELETE ON eds_analyses
+    FOR EACH STATEMENT EXECUTE FUNCTION enqueue_mv_refresh();
+
+DROP TRIGGER IF EXISTS trg_ftir_mv_refresh ON ftir_analyses;
+CREATE TRIGGER trg_ftir_mv_refresh
+    AFTER INSERT OR UPDATE OR DELETE ON ftir_analyses
+    FOR EACH STATEMENT EXECUTE FUNCTION enqueue_mv_refresh();
+
+-- The client refreshes synchronously after its own writes via the
+-- refresh_library_mvs() RPC (see refresh_library_mvs.sql). The optional
+-- pg_cron drain below covers writes that bypass the client, e.g. bulk
+-- SQL imports (at most one refresh per minute):
+-- SELECT cron.schedule('refresh-library-mv', '* * * * *', $$
+--     REFRESH MATERIALIZED VIEW CONCURRENTLY library_complete_mv;
+--     REFRESH MATERIALIZED VIEW library_statistics_mv;
+--     TRUNCATE mv_refresh_queue;
+-- $$);
@@ -0,0 +1,16 @@
+-- ================================================
+-- Partial index for the multimodal library filter
+-- Run in the Supabase SQL editor
+-- ================================================
+-- get_library_entries(multimodal_only=True) filters on has_eds AND
+-- has_ftir; indexing just that slice keeps the filtered listing an
+-- index scan. library_complete is already materialized
+-- (sql/library_materialized_views.sql), so the reads hit the mv index.
+
+CREATE INDEX IF NOT EXISTS library_complete_mv_multimodal_idx
+    ON library_complete_mv (spectrum_type, material_type)
+    WHERE has_eds = true AND has_ftir = true;
+
+CREATE INDEX IF NOT EXISTS spectral_library_multimodal_idx
+    ON spectral_library (spectrum_type, material_type)
+    WHERE has_eds = true AND has_ftir = true;
@@ -0,0 +1,10 @@
+-- ================================================
+-- Index for the library-search filter combination
+-- Run in the Supabase SQL editor (after the views exist)
+-- ================================================
+-- Library searches filter library_complete_mv on spectrum_type,
+-- material_type and has_eds in one WHERE clause; a composite index on
+-- the materialized view serves all three predicates together.
+
+CREATE INDEX IF NOT EXISTS library_mv_search_filter_idx
+    ON library_complete_mv (spectrum_type, material_type, has_eds);
@@ -0,0 +1,17 @@
+-- ================================================
+-- Server-side aggregation for the search audit dashboard
+-- Run in the Supabase SQL editor
+-- ================================================
+-- One round-trip returns the counts the dashboard shows, instead of
+-- streaming the whole history for in-memory aggregation.
+
+CREATE OR REPLACE FUNCTION library_search_stats()
+RETURNS jsonb AS $$
+    SELECT jsonb_build_object(
+        'count', (SELECT count(*) FROM library_searches),
+        'accepted_count', (SELECT count(*) FROM library_searches WHERE accepted),
+        'by_type', (SELECT coalesce(jsonb_object_agg(query_type, n), '{}'::jsonb)
+                    FROM (SELECT query_type, count(*) n
+                          FROM library_searches GROUP BY query_type) x)
+    );
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,23 @@
+-- ================================================
+-- Append-only search log
+-- Run in the Supabase SQL editor
+-- ================================================
+-- search_id is generated client-side so the fire-and-forget logger can
+-- return it before the row lands. Log rows arrive in search_date order,
+-- which is exactly the access pattern BRIN indexes are cheap for.
+
+CREATE TABLE IF NOT EXISTS library_searches (
+    search_id uuid PRIMARY KEY,
+    query_spectrum_id uuid,
+    query_type text,
+    search_params jsonb,
+    results jsonb,
+    user_id uuid,
+    accepted boolean,
+    selected_id uuid,
+    feedback text,
+    search_date timestamptz DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS library_searches_date_brin
+    ON library_searches USING brin (search_date);
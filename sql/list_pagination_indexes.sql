@@ -0,0 +1,11 @@
+-- ================================================
+-- Ordering indexes for paginated list queries
+-- Run in the Supabase SQL editor
+-- ================================================
+-- The paginated getters order by created_at DESC; these indexes let the
+-- planner serve each page without sorting the whole table.
+
+CREATE INDEX IF NOT EXISTS projects_created_idx ON projects (created_at DESC);
+CREATE INDEX IF NOT EXISTS sites_created_idx    ON sites (created_at DESC);
+CREATE INDEX IF NOT EXISTS samples_created_idx  ON samples (created_at DESC);
+CREATE INDEX IF NOT EXISTS eds_analyses_created_idx ON eds_analyses (created_at DESC);
@@ -0,0 +1,14 @@
+-- ================================================
+-- Per-material-type library counts
+-- Run in the Supabase SQL editor
+-- ================================================
+-- The statistics tab only needs counts per material type; a GROUP BY
+-- here replaces fetching every entry and tallying in Python.
+
+CREATE OR REPLACE FUNCTION material_type_counts()
+RETURNS TABLE (material_type text, count bigint) AS $$
+    SELECT COALESCE(material_type, 'unknown'), count(*)
+    FROM spectral_library
+    GROUP BY 1
+    ORDER BY 2 DESC;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,13 @@
+-- ================================================
+-- Partial index for multimodal conflict review
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Conflicts are a tiny fraction of multimodal links, but filtering
+-- multimodal_summary on agreement_level scans every row. The partial
+-- index lets the planner return conflicts in O(conflicts); keep
+-- multimodal_summary a plain projection of multimodal_analyses so the
+-- predicate pushes down to the indexed table.
+
+CREATE INDEX IF NOT EXISTS mm_conflict_idx
+    ON multimodal_analyses (link_id)
+    WHERE agreement_level = 'conflict';
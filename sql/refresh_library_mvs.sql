@@ -0,0 +1,23 @@
+-- ================================================
+-- Synchronous refresh of the library materialized views
+-- Run in the Supabase SQL editor (after the views exist)
+-- ================================================
+-- The client calls this RPC right after library writes so the next
+-- read sees the change - without it the MVs only refresh if the
+-- optional pg_cron drain is enabled, and edits appear to not save.
+-- Library writes are rare (manual curation), so refreshing inline is
+-- cheap; the cron drain in library_materialized_views.sql stays useful
+-- for bulk imports that bypass the client.
+--
+-- Plain REFRESH (not CONCURRENTLY): CONCURRENTLY cannot run inside a
+-- function's transaction. The brief exclusive lock is fine at this
+-- table size.
+
+CREATE OR REPLACE FUNCTION refresh_library_mvs()
+RETURNS void AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW library_complete_mv;
+    REFRESH MATERIALIZED VIEW library_statistics_mv;
+    TRUNCATE mv_refresh_queue;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
@@ -0,0 +1,23 @@
+-- ================================================
+-- Indexed keyword search for the spectral library
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Moves keyword matching from Python list comprehensions to an
+-- indexed array-overlap test: only matching rows cross the network.
+-- Keywords are stored lowercased (the client normalizes on write), so
+-- the overlap test hits the GIN index directly instead of lowercasing
+-- every row at query time.
+
+UPDATE spectral_library
+SET keywords = (SELECT array_agg(lower(k)) FROM unnest(keywords) AS k)
+WHERE keywords IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS lib_keywords_gin
+    ON spectral_library USING GIN (keywords);
+
+CREATE OR REPLACE FUNCTION search_library_keywords(kws text[])
+RETURNS SETOF spectral_library AS $$
+    SELECT *
+    FROM spectral_library
+    WHERE keywords && kws;
+$$ LANGUAGE sql STABLE;
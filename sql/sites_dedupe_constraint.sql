@@ -0,0 +1,10 @@
+-- ================================================
+-- Duplicate-site guard for rapid form resubmits
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Defense in depth behind the client-side idempotency key: a unique
+-- index makes the second of two racing submits fail with a 409 instead
+-- of inserting a duplicate site row.
+
+CREATE UNIQUE INDEX IF NOT EXISTS sites_dedupe_idx
+    ON sites (project_id, site_name, latitude, longitude);
@@ -0,0 +1,36 @@
+-- ================================================
+-- ANN search for the spectral library (pgvector)
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Stores each entry's elemental fingerprint as a vector(16) with an
+-- HNSW index, so top-N search is sub-linear server-side instead of
+-- shipping every row to Python for a linear scan. Element order
+-- matches _ELEMENT_COLS in database.py.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE spectral_library ADD COLUMN IF NOT EXISTS fp vector(16);
+
+UPDATE spectral_library
+SET fp = ARRAY[
+        coalesce(eds_c, 0),  coalesce(eds_n, 0),  coalesce(eds_o, 0),
+        coalesce(eds_p, 0),  coalesce(eds_ca, 0), coalesce(eds_k, 0),
+        coalesce(eds_al, 0), coalesce(eds_mn, 0), coalesce(eds_fe, 0),
+        coalesce(eds_si, 0), coalesce(eds_mg, 0), coalesce(eds_na, 0),
+        coalesce(eds_s, 0),  coalesce(eds_cl, 0), coalesce(eds_ti, 0),
+        coalesce(eds_zn, 0)
+    ]::vector
+WHERE fp IS NULL;
+
+CREATE INDEX IF NOT EXISTS spectral_library_fp_hnsw
+    ON spectral_library USING hnsw (fp vector_l2_ops);
+
+CREATE OR REPLACE FUNCTION search_library_vec(q vector, top_n int, p_spectrum_type text DEFAULT NULL)
+RETURNS TABLE (library_id uuid, distance real) AS $$
+    SELECT library_id, (fp <-> q)::real
+    FROM spectral_library
+    WHERE fp IS NOT NULL
+      AND (p_spectrum_type IS NULL OR spectrum_type = p_spectrum_type)
+    ORDER BY fp <-> q
+    LIMIT top_n;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,9 @@
+-- ================================================
+-- Unique spectrum names for library upserts
+-- Run in the Supabase SQL editor
+-- ================================================
+-- create_library_entry/bulk_upsert_library_entries upsert on
+-- spectrum_name, which needs a unique constraint to resolve conflicts.
+
+ALTER TABLE spectral_library
+    ADD CONSTRAINT spectral_library_spectrum_name_key UNIQUE (spectrum_name);
@@ -0,0 +1,21 @@
+-- ================================================
+-- EDS analyses not yet in the spectral library
+-- Run in the Supabase SQL editor
+-- ================================================
+-- The add-entry form needs the analyses that are NOT already linked as
+-- reference spectra. Doing the anti-join here ships only the available
+-- rows instead of every analysis plus the whole library.
+
+CREATE OR REPLACE FUNCTION unlinked_eds_analyses(max_rows int DEFAULT 1000)
+RETURNS SETOF eds_analyses AS $$
+    SELECT a.*
+    FROM eds_analyses a
+    LEFT JOIN spectral_library l ON l.eds_spectrum_id = a.analysis_id
+    WHERE l.library_id IS NULL
+    ORDER BY a.created_at DESC
+    LIMIT max_rows;
+$$ LANGUAGE sql STABLE;
+
+-- Anti-join probe side
+CREATE INDEX IF NOT EXISTS spectral_library_eds_spectrum_idx
+    ON spectral_library (eds_spectrum_id);
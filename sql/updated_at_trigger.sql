@@ -0,0 +1,65 @@
+-- ================================================
+-- DB-side timestamps for TaphoSpec tables
+-- Run in the Supabase SQL editor
+-- ================================================
+-- Lets Postgres maintain created_at/updated_at so the Python client
+-- never has to format and ship ISO timestamps per call.
+
+ALTER TABLE projects     ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE sites        ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE samples      ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE residues     ADD COLUMN IF NOT EXISTS created_at timestamptz DEFAULT now();
+ALTER TABLE eds_analyses ALTER COLUMN created_at SET DEFAULT now();
+
+ALTER TABLE projects     ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+ALTER TABLE sites        ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+ALTER TABLE samples      ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+ALTER TABLE eds_analyses ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_projects_updated_at ON projects;
+CREATE TRIGGER trg_projects_updated_at
+    BEFORE UPDATE ON projects
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS trg_sites_updated_at ON sites;
+CREATE TRIGGER trg_sites_updated_at
+    BEFORE UPDATE ON sites
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS trg_samples_updated_at ON samples;
+CREATE TRIGGER trg_samples_updated_at
+    BEFORE UPDATE ON samples
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS trg_eds_analyses_updated_at ON eds_analyses;
+CREATE TRIGGER trg_eds_analyses_updated_at
+    BEFORE UPDATE ON eds_analyses
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- v2.5 tables (spectral library, experimental series, multimodal links)
+ALTER TABLE spectral_library     ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+ALTER TABLE experimental_samples ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+ALTER TABLE multimodal_analyses  ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+
+DROP TRIGGER IF EXISTS trg_spectral_library_updated_at ON spectral_library;
+CREATE TRIGGER trg_spectral_library_updated_at
+    BEFORE UPDATE ON spectral_library
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS trg_experimental_samples_updated_at ON experimental_samples;
+CREATE TRIGGER trg_experimental_samples_updated_at
+    BEFORE UPDATE ON experimental_samples
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS trg_multimodal_analyses_updated_at ON multimodal_analyses;
+CREATE TRIGGER trg_multimodal_analyses_updated_at
+    BEFORE UPDATE ON multimodal_analyses
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();